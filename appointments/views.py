@@ -3,6 +3,7 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Count, Q
 from .models import Appointment
 from persons.models import Person
+from persons.functions import search_persons
 from services.models import Status
 from orders.models import Order
 from django.core.paginator import Paginator
@@ -10,7 +11,7 @@ from datetime import datetime, timedelta
 from django.utils import timezone
 from django.contrib import messages
 from django.db.models.functions import Lower
-from common.helpers import Unaccent
+from common.helpers import Unaccent, paginate_objects
 
 # Create your views here.
 
@@ -55,20 +56,18 @@ def appointments(request):
     if search:
         search = search.lower()
         appointments_queryset = appointments_queryset.filter(
-            Q(person_firstname_unaccent__icontains=search) |
-            Q(person_lastname_unaccent__icontains=search) |
-            Q(person_company_unaccent__icontains=search) |
-            Q(with_firstname_unaccent__icontains=search) |
-            Q(with_lastname_unaccent__icontains=search) |
-            Q(with_company_unaccent__icontains=search)
+            Q(person_firstname_unaccent__contains=search) |
+            Q(person_lastname_unaccent__contains=search) |
+            Q(person_company_unaccent__contains=search) |
+            Q(with_firstname_unaccent__contains=search) |
+            Q(with_lastname_unaccent__contains=search) |
+            Q(with_company_unaccent__contains=search)
         )
 
-    filtered_appointments = appointments_queryset.order_by("schedule")
+    filtered_appointments = appointments_queryset.order_by("schedule", "id")
 
     # Pagination
-    page = request.GET.get("page")
-    paginator = Paginator(filtered_appointments, 10)
-    appointments_on_page = paginator.get_page(page)
+    appointments_on_page = paginate_objects(request, filtered_appointments, keyset=True)
 
     return render(request, "appointments/appointments.html", {
         "selected_appointments": appointments_on_page,
@@ -95,19 +94,11 @@ def appointment(request, appointment_id):
             if "c_search" in request.POST:
                 c_search = request.POST.get("c_search")
                 if len(c_search) > 2:
-                    clients = Person.objects.filter(
-                        Q(firstname__icontains=c_search)
-                        | Q(lastname__icontains=c_search)
-                        | Q(company_name__icontains=c_search)
-                    )
+                    clients = search_persons(c_search, "client")[:30]
             if "p_search" in request.POST:
                 p_search = request.POST.get("p_search")
                 if len(p_search) > 2:
-                    providers = Person.objects.filter(
-                        Q(firstname__icontains=p_search)
-                        | Q(lastname__icontains=p_search)
-                        | Q(company_name__icontains=p_search)
-                    )
+                    providers = search_persons(p_search, "provider")[:30]
             if "new_client" in request.POST:
                 client_id = request.POST.get("new_client")
                 try:
@@ -152,19 +143,11 @@ def appointment(request, appointment_id):
             if "c_search" in request.POST:
                 c_search = request.POST.get("c_search")
                 if len(c_search) > 2:
-                    clients = Person.objects.filter(
-                        Q(firstname__icontains=c_search)
-                        | Q(lastname__icontains=c_search)
-                        | Q(company_name__icontains=c_search)
-                    )
+                    clients = search_persons(c_search, "client")[:30]
             if "p_search" in request.POST:
                 p_search = request.POST.get("p_search")
                 if len(p_search) > 2:
-                    providers = Person.objects.filter(
-                        Q(firstname__icontains=p_search)
-                        | Q(lastname__icontains=p_search)
-                        | Q(company_name__icontains=p_search)
-                    )
+                    providers = search_persons(p_search, "provider")[:30]
             if "new_client" in request.POST:
                 client_id = request.POST.get("new_client")
                 try:
@@ -0,0 +1,178 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.db import connections
+from django.utils.html import format_html, format_html_join
+from pypdf import PdfWriter
+from invoices.models import Invoice
+from invoices.functions import invoice_print, cancellation_invoice_print
+from payments.models import Payment
+from payments.functions import receipt_print
+from . import printing
+
+# Finished exports are kept under MEDIA_ROOT/exports/<sha1 of the export parameters>.<zip or pdf>
+EXPORT_DIR = "exports"
+
+# Documents the accountant exports, selected by type and date range
+EXPORT_TYPES = {
+    "invoices": {
+        "model": Invoice,
+        "documents": lambda start, end: Invoice.objects.filter(
+            created_at__range=(start, end), cancellation_to__isnull=True
+        ),
+        "print": invoice_print,
+    },
+    "cancellations": {
+        "model": Invoice,
+        "documents": lambda start, end: Invoice.objects.filter(
+            created_at__range=(start, end), cancellation_to__isnull=False
+        ),
+        "print": cancellation_invoice_print,
+    },
+    "receipts": {
+        "model": Payment,
+        "documents": lambda start, end: Payment.objects.filter(
+            payment_date__range=(start.date(), end.date()), type="cash", is_client=True
+        ),
+        "print": lambda payment: receipt_print(payment, cancellation=payment.cancellation_to_id is not None),
+    },
+}
+
+def export_jobs(types, start, end):
+    """Lists the (type, id) of every document to export, ordered by type and date."""
+    jobs = []
+    for export_type in types:
+        documents = EXPORT_TYPES[export_type]["documents"](start, end)
+        jobs += [(export_type, pk) for pk in documents.order_by("created_at", "id").values_list("id", flat=True)]
+    return jobs
+
+def load_job(job):
+    export_type, pk = job
+    document = EXPORT_TYPES[export_type]["model"].objects.get(id=pk)
+    return document, EXPORT_TYPES[export_type]["print"](document)
+
+def render_job(job):
+    """Stores the PDF of one document, returns (job, file name, path, error). Runs in the pool."""
+    try:
+        document, print_job = load_job(job)
+        path = printing.stored_pdf(
+            document, print_job["template"], print_job["context"], immutable=print_job.get("immutable", False)
+        )
+        return job, f"{job[0]}/{print_job['filename']}", path, None
+    except Exception as e:
+        return job, None, None, f"{type(e).__name__}: {e}"
+
+def render_jobs(jobs, workers=None):
+    """
+    Renders the documents on a process pool (one process per CPU by default), yielding the results
+    in the order of the jobs as soon as they are ready. It closes the database connections and forks,
+    so it only runs in a process of its own (the export_pdfs command, the job worker), never in a request.
+    """
+    # The forked processes must open their own database connections
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as pool:
+        yield from pool.map(render_job, jobs, chunksize=4)
+
+class StreamBuffer:
+    """A write only file for zipfile, whose content is taken out after every document."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_zip(results, progress=None):
+    """
+    Streams a ZIP with the rendered PDFs, copying one stored file at a time so the archive
+    is never held in memory. Failed documents are listed in errors.txt at the end.
+    """
+    buffer = StreamBuffer()
+    errors = []
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for count, (job, filename, path, error) in enumerate(results, 1):
+            if error:
+                errors.append(f"{job[0]} #{job[1]}: {error}")
+            else:
+                info = zipfile.ZipInfo(filename, date_time=time.localtime(os.path.getmtime(path))[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, "rb") as source, archive.open(info, "w") as target:
+                    while chunk := source.read(65536):
+                        target.write(chunk)
+            if progress:
+                progress(count, job, error)
+            yield buffer.take()
+        if errors:
+            archive.writestr("errors.txt", "\n".join(errors) + "\n")
+    yield buffer.take()
+
+def errors_page(errors):
+    """A last page listing the documents that failed, the errors.txt of a merged PDF."""
+    html_content = format_html(
+        "<html><body><h3>{} Dokumente fehlen im Export</h3><ul>{}</ul></body></html>",
+        len(errors), format_html_join("", "<li>{}</li>", ((error,) for error in errors)),
+    )
+    return io.BytesIO(printing.render_pdf(html_content, "static/css/invoice.css"))
+
+def merged_pdf(jobs, progress=None, workers=None):
+    """
+    Renders the documents on the render_jobs pool into the PDF store and returns an open temporary file
+    with their stored PDFs appended one after the other, so no WeasyPrint layout is kept in memory.
+    Failed documents are listed on a last page.
+    """
+    writer = PdfWriter()
+    errors = []
+    for count, (job, filename, path, error) in enumerate(render_jobs(jobs, workers), 1):
+        if error:
+            errors.append(f"{job[0]} #{job[1]}: {error}")
+        else:
+            writer.append(path)
+        if progress:
+            progress(count, job, error)
+    if errors:
+        writer.append(errors_page(errors))
+    merged = tempfile.TemporaryFile()
+    writer.write(merged)
+    writer.close()
+    merged.seek(0)
+    return merged
+
+def export_path(params):
+    """The file of an export, the same for every export with the same types, range and format."""
+    key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return os.path.join(settings.MEDIA_ROOT, EXPORT_DIR, f"{key}.{'pdf' if params['format'] == 'pdf' else 'zip'}")
+
+def write_export(jobs, path, merge=False, workers=None, progress=None):
+    """Writes the documents to path as a ZIP or one merged PDF, through a temporary file like the PDF store."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as output:
+        try:
+            if merge:
+                with merged_pdf(jobs, progress, workers) as merged:
+                    shutil.copyfileobj(merged, output)
+            else:
+                for chunk in stream_zip(render_jobs(jobs, workers), progress):
+                    output.write(chunk)
+        except BaseException:
+            output.close()
+            os.unlink(output.name)
+            raise
+    os.replace(output.name, path)
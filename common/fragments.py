@@ -0,0 +1,72 @@
+import math
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+from orders.models import Order, OrderElement
+from invoices.models import Invoice, InvoiceElement, ProformaElement
+from payments.models import PaymentElement
+from persons.models import Person
+
+# Rendered dashboard boxes are cached under the version of the box.
+# Saving or deleting a row the box is built from moves the version once the transaction commits,
+# bulk writes that skip the signals (queryset.update, bulk_update) are followed by an Order save.
+FRAGMENT_TIMEOUT = 60 * 60
+
+ORDER_BOXES = ("recent_orders", "client_orders", "provider_orders")
+INVOICE_BOXES = ("client_invoices", "provider_invoices")
+
+# The boxes built from each model
+FRAGMENT_SOURCES = {
+    Order: ORDER_BOXES + INVOICE_BOXES,
+    OrderElement: ORDER_BOXES,
+    InvoiceElement: ("client_orders", "provider_orders"),
+    ProformaElement: ("client_orders",),
+    Invoice: ("client_orders", "provider_orders") + INVOICE_BOXES,
+    PaymentElement: INVOICE_BOXES,
+    Person: ORDER_BOXES + INVOICE_BOXES,
+}
+
+def version_key(name):
+    return f"fragment:version:{name}"
+
+def fragment_key(name):
+    version = cache.get(version_key(name))
+    if version is None:
+        # A lost version must not fall back to one an outdated fragment was cached under
+        cache.add(version_key(name), time.time_ns(), None)
+        version = cache.get(version_key(name))
+    return f"fragment:{name}:{version}"
+
+def cached_fragment(name, render):
+    """
+    Returns (html, hit) for a fragment. On a miss render() returns the html and the time
+    it stops being correct (or None), e.g. the next deadline that turns an alert on.
+    """
+    key = fragment_key(name)
+    html = cache.get(key)
+    if html is not None:
+        return html, True
+    html, expires = render()
+    timeout = FRAGMENT_TIMEOUT
+    if expires is not None:
+        timeout = max(1, min(timeout, math.ceil((expires - timezone.now()).total_seconds())))
+    cache.set(key, html, timeout)
+    return html, False
+
+def invalidate(names):
+    def bump_versions():
+        cache.set_many({version_key(name): time.time_ns() for name in names}, None)
+    transaction.on_commit(bump_versions)
+
+# signal receivers
+
+def source_changed(sender, **kwargs):
+    if not kwargs.get("raw"):
+        invalidate(FRAGMENT_SOURCES[sender])
+
+def connect():
+    for model in FRAGMENT_SOURCES:
+        post_save.connect(source_changed, sender=model)
+        post_delete.connect(source_changed, sender=model)
@@ -1,9 +1,11 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.core.paginator import Paginator
-from django.db.models import Q, Func
+from django.db.models import Q, Func, Subquery
 from django.utils.dateparse import parse_date
-from django.db import models
+from django.db import models, connection
 from services.models import Status
 
 def get_date_range(request, default_days=10, date_end=0):
@@ -47,18 +49,151 @@ def get_search_params(request):
 
     return search_client, search_provider, search_description
 
-def paginate_objects(request, object_list, per_page=10):
-    """Applies pagination to a list of objects."""
+def sort_objects(queryset, sort, sort_keys, default="created_at", ascending=()):
+    """
+    Orders a queryset by the field mapped to the sort key, or by a tuple of fields (e.g. serial and number),
+    descending unless the key is in ascending.
+    """
+    fields = sort_keys.get(sort, default)
+    fields = (fields,) if isinstance(fields, str) else tuple(fields)
+    if sort in ascending:
+        return queryset.order_by(*fields, "id")
+    return queryset.order_by(*(f"-{field}" for field in fields), "-id")
+
+def paginate_objects(request, object_list, per_page=10, keyset=False, estimate=False):
+    """Applies pagination to a list of objects, or cursor pagination to an ordered queryset if keyset is set."""
+    if keyset:
+        return paginate_keyset(request, object_list, per_page, estimate)
     page = request.GET.get("page", 1)
     paginator = Paginator(object_list, per_page)
     return paginator.get_page(page)
 
+class KeysetPage:
+    """A page of a cursor paginated queryset, with the cursors of the neighbouring pages."""
+
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None, estimated_total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.estimated_total = estimated_total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+def encode_cursor(values):
+    """Packs the (sort keys..., id) values of a row into an url safe cursor."""
+    # keeps full microseconds, DjangoJSONEncoder would round them and break the equality on ties
+    def default(value):
+        return value.isoformat() if hasattr(value, "isoformat") else str(value)
+    return urlsafe_b64encode(json.dumps(values, default=default).encode()).decode()
+
+def decode_cursor(cursor):
+    """Unpacks a cursor made by encode_cursor, None if it is missing or damaged."""
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+    return values if isinstance(values, list) and len(values) >= 2 else None
+
+def estimate_total(model):
+    """Returns the planner's row estimate of the model table from pg_class.reltuples instead of a COUNT(*)."""
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+        row = cursor.fetchone()
+    # reltuples is -1 until the table is vacuumed or analyzed for the first time
+    return row[0] if row and row[0] >= 0 else None
+
+def paginate_keyset(request, queryset, per_page=10, estimate=False):
+    """
+    Applies cursor pagination to a queryset ordered by (sort keys..., id), all in the same direction.
+    The page is selected by the "after" or "before" cursor from the request, so every page costs
+    the same index scan as the first one and no COUNT(*) is run.
+    """
+    ordering = list(queryset.query.order_by) or ["id"]
+    descending = ordering[0].startswith("-")
+    fields = [field for field in dict.fromkeys(order.lstrip("-") for order in ordering) if field != "id"]
+
+    def cursor_param(name):
+        values = decode_cursor(request.GET.get(name, ""))
+        return values if values and len(values) == len(fields) + 1 else None
+
+    after, before = cursor_param("after"), cursor_param("before")
+
+    def keyset_filter(values, lookup):
+        # the rows past the cursor: past it on the first sort key, or equal on it and past it on the next ones
+        *sort_values, pk = values
+        rows = Q(**{f"id__{lookup}": pk})
+        for field, value in reversed(list(zip(fields, sort_values))):
+            # PostgreSQL sorts NULL above every value (last ascending, first descending)
+            if value is None:
+                same = Q(**{f"{field}__isnull": True})
+                past = None if lookup == "gt" else Q(**{f"{field}__isnull": False})
+            else:
+                same = Q(**{field: value})
+                past = Q(**{f"{field}__{lookup}": value})
+                if lookup == "gt":
+                    past |= Q(**{f"{field}__isnull": True})
+            rows = same & rows if past is None else past | (same & rows)
+        return rows
+
+    def cursor_of(obj):
+        values = []
+        for field in fields:
+            value = obj
+            for part in field.split("__"):
+                value = getattr(value, part, None)
+            values.append(value)
+        return encode_cursor(values + [obj.pk])
+
+    forward, backward = ("lt", "gt") if descending else ("gt", "lt")
+    if after:
+        queryset = queryset.filter(keyset_filter(after, forward))
+    elif before:
+        queryset = queryset.filter(keyset_filter(before, backward)).reverse()
+
+    rows = list(queryset[: per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before and not after:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, bool(after)
+
+    return KeysetPage(
+        rows,
+        next_cursor=cursor_of(rows[-1]) if rows and has_next else None,
+        prev_cursor=cursor_of(rows[0]) if rows and has_previous else None,
+        estimated_total=estimate_total(queryset.model) if estimate else None,
+    )
+
 class Unaccent(Func):
-    function = 'unaccent'
+    """
+    unaccent() through the immutable se_unaccent() wrapper (persons migration 0004).
+    Unaccent(Lower(field)) with a case sensitive __contains matches the trigram indexes of persons.
+    """
+    function = 'se_unaccent'
     arity = 1
     output_field = models.TextField()
 
-    def as_sql(self, compiler, connection, **extra_context):
-        self.source_expressions[0].output_field = None  # prevenim forțarea de tip
-        sql, params = compiler.compile(self.source_expressions[0])
-        return f'unaccent({sql}::text)', params
+class SubqueryCount(Subquery):
+    """
+    COUNT(*) of a correlated queryset (filtered on an OuterRef) as an annotation. Counting two relations
+    this way keeps them apart, a Count over two joins multiplies their rows before counting.
+    """
+    template = "(SELECT count(*) FROM (%(subquery)s) _count)"
+    output_field = models.IntegerField()
@@ -0,0 +1,147 @@
+import traceback
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Job
+
+# Retry delay after a failed attempt: BACKOFF_BASE * 2^(attempt - 1) seconds, at most BACKOFF_MAX
+BACKOFF_BASE = 10
+BACKOFF_MAX = 3600
+
+# Task functions take the job payload and a progress(done, total) callback and return a JSON result.
+# A task can run more than once (retries, a worker killed mid job), so every task must be safe to repeat.
+
+# A running job writes its progress every PROGRESS_STEP steps
+PROGRESS_STEP = 10
+
+def print_pdf(payload, progress):
+    """Renders a document's html into the PDF store, the print view serves it from there (see print_document)."""
+    from .printing import store_pdf
+    store_pdf(payload["key"], payload["html"], payload["stylesheet"], payload["version"])
+    return {"key": payload["key"]}
+
+def export_documents(payload, progress):
+    """Writes a bulk export of documents (see common.exports), the export view serves the file."""
+    from .exports import export_jobs, export_path, write_export
+    jobs = export_jobs(payload["types"], parse_datetime(payload["start"]), parse_datetime(payload["end"]))
+    failed = []
+    path = export_path(payload)
+
+    def rendered(count, job, error):
+        if error:
+            failed.append(f"{job[0]} #{job[1]}: {error}")
+        progress(count, len(jobs))
+
+    progress(0, len(jobs))
+    write_export(jobs, path, merge=payload["format"] == "pdf", progress=rendered)
+    return {"path": path, "documents": len(jobs), "failed": failed}
+
+def sftp_upload(payload, progress):
+    """Uploads a file over SFTP, overwriting the remote copy."""
+    from services.views import upload_file_via_sftp
+    upload_file_via_sftp(payload["local"], payload["remote"])
+    return {"remote": payload["remote"]}
+
+TASKS = {
+    "print_pdf": print_pdf,
+    "export_documents": export_documents,
+    "sftp_upload": sftp_upload,
+}
+
+def enqueue(task, payload=None, key="", max_attempts=5):
+    """
+    Queues a task, or returns the job already waiting for the same key,
+    so clicking twice does not run the same work twice. A job already running
+    does not count: the work it started from may have changed since.
+    """
+    if task not in TASKS:
+        raise ValueError(f"Unknown task: {task}")
+    if key:
+        pending = Job.objects.filter(key=key, status="queued").first()
+        if pending:
+            return pending
+    try:
+        with transaction.atomic():
+            return Job.objects.create(task=task, key=key, payload=payload or {}, max_attempts=max_attempts)
+    except IntegrityError:
+        # another request queued the same key in the meantime (job_queued_key), unless a worker took it already
+        pending = Job.objects.filter(key=key, status="queued").first()
+        return pending or enqueue(task, payload, key, max_attempts)
+
+def superseded(job):
+    """True when a newer job waits for the same key, it repeats the work anyway."""
+    return bool(job.key) and Job.objects.filter(key=job.key, status="queued").exclude(id=job.id).exists()
+
+def claim_job():
+    """Takes the next due job and marks it running; SKIP LOCKED lets several workers share the queue."""
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            status="queued", run_after__lte=timezone.now()
+        ).order_by("run_after", "id").first()
+        if job is None:
+            return None
+        job.status = "running"
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "attempts", "started_at"])
+    return job
+
+def progress_writer(job):
+    """The progress callback of a job, writing every PROGRESS_STEP steps and the last one."""
+    def progress(done, total):
+        if done == 0 or done == total or done % PROGRESS_STEP == 0:
+            job.progress = {"done": done, "total": total}
+            Job.objects.filter(id=job.id).update(progress=job.progress)
+    return progress
+
+def run_job(job):
+    """Runs a claimed job, scheduling a retry with exponential backoff when it fails."""
+    try:
+        result = TASKS[job.task](job.payload, progress_writer(job))
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts and not superseded(job):
+            job.status = "queued"
+            job.run_after = timezone.now() + timedelta(
+                seconds=min(BACKOFF_BASE * 2 ** (job.attempts - 1), BACKOFF_MAX)
+            )
+        else:
+            job.status = "failed"
+            job.finished_at = timezone.now()
+    else:
+        job.status = "done"
+        job.result = result
+        job.error = ""
+        job.finished_at = timezone.now()
+    try:
+        with transaction.atomic():
+            job.save(update_fields=["status", "result", "error", "run_after", "finished_at"])
+    except IntegrityError:
+        # the same key was queued again while the retry was scheduled
+        job.status = "failed"
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "result", "error", "run_after", "finished_at"])
+    return job
+
+def requeue_stale(timeout=timedelta(minutes=30)):
+    """Puts back jobs left running by a worker that died, they are repeated from the start."""
+    stale = Job.objects.filter(status="running", started_at__lt=timezone.now() - timeout)
+    # a job queued again for the same key meanwhile repeats the work, the stale one is given up
+    stale.filter(Exists(Job.objects.filter(key=OuterRef("key"), status="queued").exclude(key=""))).update(
+        status="failed", error="Superseded by a queued job with the same key.", finished_at=timezone.now()
+    )
+    return stale.update(status="queued")
+
+def job_status(job):
+    return {
+        "id": job.id,
+        "task": job.task,
+        "status": job.status,
+        "attempts": job.attempts,
+        "run_after": job.run_after.isoformat(),
+        "progress": job.progress,
+        "result": job.result,
+        "error": job.error.strip().splitlines()[-1] if job.error else "",
+    }
@@ -0,0 +1,55 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+from weasyprint import HTML, CSS
+from invoices.models import Invoice, InvoiceElement
+from common import printing
+
+
+class Command(BaseCommand):
+    help = 'Measures the first and the steady state PDF render time of an invoice'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--invoice", type=int, help="Invoice id (default: the latest invoice).")
+        parser.add_argument("--repeat", type=int, default=10, help="Number of steady state renders (default 10).")
+
+    def handle(self, *args, **options):
+        invoice = Invoice.objects.filter(id=options["invoice"]).first() if options["invoice"] else Invoice.objects.last()
+        if invoice is None:
+            raise CommandError("No invoice to render.")
+        repeat = max(1, options["repeat"])
+        stylesheet = "static/css/invoice.css"
+
+        def html_content():
+            return render_to_string("payments/print_invoice.html", {
+                "invoice": invoice,
+                "invoice_elements": InvoiceElement.objects.filter(invoice=invoice).order_by("id"),
+                "leading_invoice": invoice.number.rjust(4, '0'),
+                "logo_base64": printing.read_logo(),
+            })
+
+        # Cold: the first render of the worker loads the logo, the stylesheet and the fonts
+        started = time.perf_counter()
+        printing.render_pdf(html_content(), stylesheet)
+        first = time.perf_counter() - started
+
+        warm = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            printing.render_pdf(html_content(), stylesheet)
+            warm.append(time.perf_counter() - started)
+
+        # The same render without shared resources, as every print view did before
+        css_content = printing.load_stylesheet(stylesheet)[0]
+        unshared = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            HTML(string=html_content()).write_pdf(stylesheets=[CSS(string=css_content)])
+            unshared.append(time.perf_counter() - started)
+
+        self.stdout.write(f"Invoice {invoice.serial}-{invoice.number}, {repeat} renders")
+        self.stdout.write(f"  first render:          {first * 1000:.1f} ms")
+        self.stdout.write(f"  steady state (shared): {statistics.median(warm) * 1000:.1f} ms median")
+        self.stdout.write(f"  without shared:        {statistics.median(unshared) * 1000:.1f} ms median")
+        self.stdout.write(self.style.SUCCESS(f"Worker timings: {printing.render_timings()}"))
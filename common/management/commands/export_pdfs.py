@@ -0,0 +1,60 @@
+import os
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from common.exports import EXPORT_TYPES, export_jobs, write_export
+
+
+class Command(BaseCommand):
+    help = 'Exports the invoices, cancellation invoices and cash receipts of a date range as a ZIP or one merged PDF'
+
+    def add_arguments(self, parser):
+        parser.add_argument("start", help="First day (YYYY-MM-DD).")
+        parser.add_argument("end", help="Last day (YYYY-MM-DD).")
+        parser.add_argument("output", help="Path of the .zip or .pdf file to write.")
+        parser.add_argument(
+            "--types",
+            default=",".join(EXPORT_TYPES),
+            help=f"Comma separated document types (default: {','.join(EXPORT_TYPES)}).",
+        )
+        parser.add_argument("--merge", action="store_true", help="Write one merged PDF instead of a ZIP.")
+        parser.add_argument("--workers", type=int, help="Number of render processes (default: one per CPU).")
+
+    def handle(self, *args, **options):
+        start, end = parse_date(options["start"]), parse_date(options["end"])
+        if start is None or end is None or start > end:
+            raise CommandError("Invalid date range.")
+        types = [t.strip() for t in options["types"].split(",") if t.strip()]
+        unknown = [t for t in types if t not in EXPORT_TYPES]
+        if unknown:
+            raise CommandError(f"Unknown document types: {', '.join(unknown)}")
+
+        jobs = export_jobs(
+            types,
+            timezone.make_aware(datetime.combine(start, datetime.min.time())),
+            timezone.make_aware(datetime.combine(end, datetime.max.time())),
+        )
+        self.stdout.write(f"Exporting {len(jobs)} documents...")
+        started = time.perf_counter()
+        self.failures = 0
+
+        write_export(
+            jobs, os.path.abspath(options["output"]), options["merge"], options["workers"], self.progress(len(jobs))
+        )
+
+        summary = f"{len(jobs) - self.failures} documents exported to {options['output']} in {time.perf_counter() - started:.1f}s"
+        if self.failures:
+            self.stdout.write(self.style.WARNING(f"{summary}, {self.failures} failed."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{summary}."))
+
+    def progress(self, total):
+        def report(count, job, error):
+            if error:
+                self.failures += 1
+                self.stderr.write(f"[{count}/{total}] {job[0]} #{job[1]} failed: {error}")
+            elif count % 25 == 0 or count == total:
+                self.stdout.write(f"[{count}/{total}] done")
+        return report
@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from common.jobs import claim_job, run_job, requeue_stale
+
+
+class Command(BaseCommand):
+    help = 'Runs the queued background jobs (PDF rendering, document exports, SFTP uploads)'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sleep", type=float, default=2, help="Seconds to wait when the queue is empty (default 2).")
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty.")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"{requeued} stale jobs queued again."))
+        self.stdout.write(self.style.SUCCESS("Worker started."))
+        while True:
+            close_old_connections()
+            job = claim_job()
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+            started = time.perf_counter()
+            job = run_job(job)
+            message = f"{job} attempt {job.attempts} in {time.perf_counter() - started:.2f}s"
+            if job.status == "done":
+                self.stdout.write(self.style.SUCCESS(message))
+            else:
+                self.stdout.write(self.style.ERROR(f"{message}: {job.error.strip().splitlines()[-1]}"))
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.11 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+# Keeps the oldest of several jobs waiting for the same key, the others would repeat its work
+FAIL_DUPLICATES = """
+    UPDATE common_job SET status = 'failed', error = 'Duplicate of a queued job with the same key.'
+    WHERE status = 'queued' AND key <> '' AND id NOT IN (
+        SELECT min(id) FROM common_job WHERE status = 'queued' AND key <> '' GROUP BY key
+    );
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunSQL(FAIL_DUPLICATES, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name="job",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "queued"), models.Q(("key", ""), _negated=True)),
+                fields=("key",),
+                name="job_queued_key",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0002_job_queued_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="progress",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,37 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
+
+
+class Job(models.Model):
+    """A unit of slow work (PDF rendering, document exports, SFTP uploads) run by `manage.py run_worker`."""
+    status_choices = [("queued", "Queued"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")]
+    task = models.CharField(max_length=50)
+    key = models.CharField(max_length=200, blank=True)  # same key = same work, queued only once
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=status_choices, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    result = models.JSONField(null=True, blank=True)
+    progress = models.JSONField(null=True, blank=True)  # {"done": n, "total": m} while a long task runs
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+            models.Index(fields=["key"]),
+        ]
+        constraints = [
+            # one waiting job per key, a job already running can have its follow-up queued
+            models.UniqueConstraint(
+                fields=["key"], condition=models.Q(status="queued") & ~models.Q(key=""), name="job_queued_key"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.id} {self.task} ({self.status})"
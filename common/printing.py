@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import os
+import tempfile
+import time
+from functools import lru_cache
+from django.conf import settings
+from django.http import FileResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
+from .jobs import enqueue
+
+# Generated PDFs are kept under MEDIA_ROOT/pdfs/<first two hash chars>/<sha256 of html + css>.pdf,
+# issued documents also get MEDIA_ROOT/pdfs/<model>/<id>-<modified_at>.txt pointing to their PDF.
+PDF_DIR = "pdfs"
+LOGO = "static/images/logo-se.jpeg"
+
+# Render timings of this worker, in seconds
+RENDER_TIMINGS = {"renders": 0, "total": 0.0, "first": None, "last": None}
+
+# The logo, the stylesheets and the font configuration are loaded once per worker and reused by every render
+
+@lru_cache(maxsize=None)
+def font_config():
+    return FontConfiguration()
+
+@lru_cache(maxsize=None)
+def read_logo():
+    with open(os.path.join(settings.BASE_DIR, LOGO), "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
+@lru_cache(maxsize=None)
+def load_stylesheet(path):
+    """Returns the text of a stylesheet and its parsed CSS object."""
+    with open(os.path.join(settings.BASE_DIR, path), "rb") as f:
+        content = f.read().decode("utf-8")
+    return content, CSS(string=content, font_config=font_config())
+
+def render_pdf(html_content, stylesheet):
+    started = time.perf_counter()
+    pdf = HTML(string=html_content).write_pdf(
+        stylesheets=[load_stylesheet(stylesheet)[1]], font_config=font_config()
+    )
+    duration = time.perf_counter() - started
+    if RENDER_TIMINGS["first"] is None:
+        RENDER_TIMINGS["first"] = duration
+    RENDER_TIMINGS["renders"] += 1
+    RENDER_TIMINGS["total"] += duration
+    RENDER_TIMINGS["last"] = duration
+    return pdf
+
+def render_timings():
+    """Returns the render timings of this worker, with the average render time."""
+    renders = RENDER_TIMINGS["renders"]
+    return dict(RENDER_TIMINGS, average=RENDER_TIMINGS["total"] / renders if renders else None)
+
+def version_stamp(document):
+    return int(document.modified_at.timestamp() * 1000000)
+
+def document_version(document):
+    """Identifies the state of a document by its model, id and modified_at."""
+    return f"{document._meta.label_lower}-{document.pk}-{version_stamp(document)}"
+
+def stored_path(key):
+    return os.path.join(settings.MEDIA_ROOT, PDF_DIR, key[:2], f"{key}.pdf")
+
+def version_path(document):
+    return os.path.join(
+        settings.MEDIA_ROOT, PDF_DIR, document._meta.label_lower, f"{document.pk}-{version_stamp(document)}.txt"
+    )
+
+def write_file(path, content):
+    """Writes through a temporary file, so a concurrent reader never sees half a PDF."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # a unique name per writer, two threads rendering the same key must not share it
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as f:
+        f.write(content)
+    os.replace(f.name, path)
+
+def read_version(document):
+    """Returns the stored PDF key of an issued document, None if it was not printed in this state yet."""
+    try:
+        with open(version_path(document)) as f:
+            key = f.read().strip()
+    except OSError:
+        return None
+    return key if os.path.exists(stored_path(key)) else None
+
+def pdf_source(document, template, context, stylesheet="static/css/invoice.css", immutable=False):
+    """
+    Returns (key, html) of the document's PDF in the content addressed store. Immutable (issued) documents
+    are taken from their stored version without rendering the template again, until they are modified:
+    html is None then.
+    """
+    key = read_version(document) if immutable else None
+    if key is not None:
+        return key, None
+    context["logo_base64"] = read_logo()
+    html_content = render_to_string(template, context)
+    css_content = load_stylesheet(stylesheet)[0]
+    return hashlib.sha256((html_content + css_content).encode("utf-8")).hexdigest(), html_content
+
+def store_pdf(key, html_content, stylesheet="static/css/invoice.css", version=""):
+    """Renders the html with WeasyPrint unless its PDF is stored already, and records it as a document version."""
+    if not os.path.exists(stored_path(key)):
+        write_file(stored_path(key), render_pdf(html_content, stylesheet))
+    if version:
+        write_file(version, key.encode())
+    return stored_path(key)
+
+def stored_pdf(document, template, context, stylesheet="static/css/invoice.css", immutable=False):
+    """Returns the path of the document's PDF in the store, rendering it when it was not stored yet."""
+    key, html_content = pdf_source(document, template, context, stylesheet, immutable)
+    if html_content is None:
+        return stored_path(key)
+    return store_pdf(key, html_content, stylesheet, version_path(document) if immutable else "")
+
+def print_document(request, document, template, context, filename, stylesheet="static/css/invoice.css", immutable=False):
+    """
+    Serves the stored PDF of a document (see pdf_source), answering conditional requests from modified_at.
+    A PDF that is not stored yet is rendered by the job worker: the page waits for the job and reloads.
+    """
+    etag = quote_etag(document_version(document))
+    last_modified = int(document.modified_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        key, html_content = pdf_source(document, template, context, stylesheet, immutable)
+        version = version_path(document) if immutable else ""
+        if html_content is not None and not os.path.exists(stored_path(key)):
+            # Getting the same missing PDF twice queues one job, keyed by the content
+            job = enqueue(
+                "print_pdf",
+                {"key": key, "html": html_content, "stylesheet": stylesheet, "version": version},
+                key=f"print_pdf:{key}",
+            )
+            response = render(request, "print_pending.html", {"job": job, "filename": filename}, status=202)
+            # no validators: the reload after the job must not be answered with a 304 of this page
+            response["Cache-Control"] = "no-store"
+            return response
+        if html_content is not None:
+            path = store_pdf(key, html_content, stylesheet, version)
+        else:
+            path = stored_path(key)
+        response = FileResponse(open(path, "rb"), content_type="application/pdf")
+        response["Content-Disposition"] = f"filename={filename}"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "private, no-cache"
+    return response
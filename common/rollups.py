@@ -0,0 +1,135 @@
+from django.db.models import F, Sum, Case, When, Value, DecimalField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_init, post_save, post_delete
+from orders.models import Order
+from invoices.models import Invoice, InvoiceElement
+from payments.models import PaymentElement
+
+# Rollup maintenance for Order.invoiced and Invoice.payed.
+# Single row saves and deletes are followed through signals; bulk writes
+# (bulk_create, queryset.update) must call the apply/refresh functions themselves.
+
+def is_counted(invoice):
+    """Cancelled invoices and cancellation invoices are not counted as invoiced."""
+    return invoice.cancelled_from_id is None and invoice.cancellation_to_id is None
+
+def apply_deltas(model, field, deltas):
+    """Adds the {id: amount} deltas to the field with a single UPDATE."""
+    deltas = {pk: amount for pk, amount in deltas.items() if amount}
+    if not deltas:
+        return
+    model.objects.filter(id__in=deltas).update(**{
+        field: F(field) + Case(
+            *[When(id=pk, then=Value(amount)) for pk, amount in deltas.items()],
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+    })
+
+def invoiced_by_order(invoice_elements):
+    """Groups the value of the invoice elements by their order: {order_id: value}."""
+    return dict(
+        invoice_elements.values_list("element__order_id").annotate(
+            total=Sum(F("element__price") * F("element__quantity"))
+        ).order_by()
+    )
+
+def apply_invoice_elements(invoice, invoice_elements, sign=1):
+    """Adds (or with sign=-1 removes) the value of the invoice elements to the invoiced value of their orders."""
+    if not is_counted(invoice):
+        return
+    totals = invoiced_by_order(invoice_elements)
+    apply_deltas(Order, "invoiced", {pk: sign * total for pk, total in totals.items()})
+
+def apply_payment_elements(payment_elements, sign=1):
+    """Adds (or with sign=-1 removes) the value of the payment elements to the payed value of their invoices."""
+    totals = dict(payment_elements.values_list("invoice_id").annotate(total=Sum("value")).order_by())
+    apply_deltas(Invoice, "payed", {pk: sign * total for pk, total in totals.items()})
+
+def apply_payment_element_changes(elements):
+    """
+    Follows a bulk_create or bulk_update of payment elements, which sends no signals:
+    moves Invoice.payed by what every element changed since it was loaded, with a single UPDATE,
+    and marks the change as applied so a later save of the same instance does not count it again.
+    """
+    deltas = {}
+    for element in elements:
+        deltas[element.invoice_id] = deltas.get(element.invoice_id, 0) + element.value - element._rollup_value
+        element._rollup_value = element.value
+    apply_deltas(Invoice, "payed", deltas)
+
+def refresh_order_invoiced(order_ids):
+    """
+    Rewrites Order.invoiced of the given orders from their invoice elements with one UPDATE,
+    so a delta a concurrent invoice adds meanwhile is counted once instead of being overwritten.
+    """
+    totals = InvoiceElement.objects.filter(
+        element__order=OuterRef("pk"),
+        invoice__cancelled_from__isnull=True,  # Exclude cancelled invoices
+        invoice__cancellation_to__isnull=True,  # Exclude cancellation invoices
+    ).values("element__order").annotate(
+        total=Sum(F("element__price") * F("element__quantity"))
+    ).values("total")
+    money = DecimalField(max_digits=10, decimal_places=2)
+    Order.objects.filter(id__in=list(order_ids)).update(
+        invoiced=Coalesce(Subquery(totals, output_field=money), Value(0, output_field=money))
+    )
+
+def refresh_invoice_payed(invoice_ids):
+    """Rewrites Invoice.payed of the given invoices from their payment elements."""
+    invoice_ids = list(invoice_ids)
+    totals = dict(
+        PaymentElement.objects.filter(invoice_id__in=invoice_ids).values_list("invoice_id").annotate(
+            total=Sum("value")
+        ).order_by()
+    )
+    invoices = list(Invoice.objects.filter(id__in=invoice_ids).only("id", "payed"))
+    for invoice in invoices:
+        invoice.payed = totals.get(invoice.id) or 0
+    Invoice.objects.bulk_update(invoices, ["payed"])
+
+# signal receivers
+
+def invoice_element_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        apply_invoice_elements(instance.invoice, InvoiceElement.objects.filter(id=instance.id))
+
+def invoice_element_deleted(sender, instance, **kwargs):
+    invoice = Invoice.objects.filter(id=instance.invoice_id).first()
+    element = instance.element
+    if invoice and is_counted(invoice):
+        apply_deltas(Order, "invoiced", {element.order_id: -(element.price * element.quantity)})
+
+def invoice_saved(sender, instance, created, raw=False, **kwargs):
+    # A new cancellation invoice takes the elements of the cancelled invoice out of the invoiced values
+    if created and not raw and instance.cancellation_to_id:
+        cancelled = Invoice.objects.get(id=instance.cancellation_to_id)
+        apply_invoice_elements(cancelled, InvoiceElement.objects.filter(invoice=cancelled), -1)
+
+def invoice_deleted(sender, instance, **kwargs):
+    # Deleting a cancellation invoice makes the cancelled invoice count again
+    if instance.cancellation_to_id:
+        cancelled = Invoice.objects.filter(id=instance.cancellation_to_id).first()
+        if cancelled:
+            apply_invoice_elements(cancelled, InvoiceElement.objects.filter(invoice=cancelled))
+
+def payment_element_loaded(sender, instance, **kwargs):
+    instance._rollup_value = instance.value if instance.pk else 0
+
+def payment_element_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = 0 if created else instance._rollup_value
+    apply_deltas(Invoice, "payed", {instance.invoice_id: instance.value - previous})
+    instance._rollup_value = instance.value
+
+def payment_element_deleted(sender, instance, **kwargs):
+    apply_deltas(Invoice, "payed", {instance.invoice_id: -instance._rollup_value})
+
+def connect():
+    post_save.connect(invoice_element_saved, sender=InvoiceElement)
+    post_delete.connect(invoice_element_deleted, sender=InvoiceElement)
+    post_save.connect(invoice_saved, sender=Invoice)
+    post_delete.connect(invoice_deleted, sender=Invoice)
+    post_init.connect(payment_element_loaded, sender=PaymentElement)
+    post_save.connect(payment_element_saved, sender=PaymentElement)
+    post_delete.connect(payment_element_deleted, sender=PaymentElement)
@@ -1,3 +1,103 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from persons.models import Person
+from services.models import Status
+from orders.models import Order, OrderElement
+from invoices.models import Invoice
+from sprachen_express_db.views import DASHBOARD_BOXES
+from .helpers import paginate_keyset, sort_objects
+from .jobs import enqueue, claim_job
+from .models import Job
 
-# Create your tests here.
+
+class EnqueueTests(TestCase):
+
+    def test_a_waiting_job_is_not_queued_twice(self):
+        first = enqueue("sftp_upload", {"local": "a", "remote": "b"}, key="sftp_upload:logo")
+        second = enqueue("sftp_upload", {"local": "a", "remote": "b"}, key="sftp_upload:logo")
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_a_running_job_gets_a_follow_up(self):
+        first = enqueue("sftp_upload", {"local": "a", "remote": "b"}, key="sftp_upload:logo")
+        self.assertEqual(claim_job().id, first.id)
+
+        # the file changed again while the first upload runs, it has to be sent once more
+        second = enqueue("sftp_upload", {"local": "a", "remote": "b"}, key="sftp_upload:logo")
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(second.status, "queued")
+
+    def test_jobs_without_a_key_are_always_queued(self):
+        enqueue("sftp_upload", {"local": "a", "remote": "b"})
+        enqueue("sftp_upload", {"local": "a", "remote": "b"})
+        self.assertEqual(Job.objects.filter(status="queued").count(), 2)
+
+
+class DashboardQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.status = Status.objects.create(id=1, name="In progress", style="info", percent=60)
+        cls.person = Person.objects.create(firstname="Anna", lastname="Schmidt")
+
+    def add_rows(self, count):
+        """An open order with two elements and an unpaid invoice, for clients and providers."""
+        for i in range(count):
+            for is_client in (True, False):
+                order = Order.objects.create(
+                    person=self.person, is_client=is_client, value=Decimal("30.00"),
+                    deadline=timezone.now() + timedelta(days=i + 1),
+                )
+                OrderElement.objects.create(order=order, quantity=2, price=Decimal("10.00"))
+                OrderElement.objects.create(order=order, quantity=1, price=Decimal("10.00"))
+                Invoice.objects.create(person=self.person, is_client=is_client, value=Decimal("30.00"))
+
+    def render_boxes(self):
+        # the boxes as the dashboard renders them on a miss, without its thread pool and fragment cache
+        for name, (partial, box) in DASHBOARD_BOXES.items():
+            rows, expires = box()
+            self.assertTrue(rows)
+            render_to_string(partial, {name: rows})
+
+    def test_the_boxes_take_a_fixed_number_of_queries(self):
+        # three order boxes with their elements prefetched, two open items boxes
+        self.add_rows(1)
+        with self.assertNumQueries(8):
+            self.render_boxes()
+
+        self.add_rows(5)
+        with self.assertNumQueries(8):
+            self.render_boxes()
+
+
+class KeysetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        person = Person.objects.create(firstname="Anna", lastname="Schmidt")
+        for serial, number in [("RE", "2"), ("SE", "1"), ("RE", "1"), ("SE", "2"), ("RE", "2"), ("SE", "1"), ("RE", "3")]:
+            Invoice.objects.create(person=person, serial=serial, number=number)
+
+    def pages(self, queryset, **params):
+        page = paginate_keyset(RequestFactory().get("/", params), queryset, per_page=2)
+        return page, [invoice.id for invoice in page]
+
+    def test_pages_of_a_tuple_sort_key(self):
+        for ascending in ((), ("receipt",)):
+            queryset = sort_objects(Invoice.objects.all(), "receipt", {"receipt": ("serial", "number")}, ascending=ascending)
+            expected = list(queryset.values_list("id", flat=True))
+
+            # forward through every page, then back from the last one
+            page, ids = self.pages(queryset)
+            seen = [ids]
+            while page.has_next():
+                page, ids = self.pages(queryset, after=page.next_cursor)
+                seen.append(ids)
+            self.assertEqual(sum(seen, []), expected)
+            while page.has_previous():
+                page, ids = self.pages(queryset, before=page.prev_cursor)
+                self.assertEqual(ids, seen[-2])
+                seen.pop()
@@ -1,3 +1,13 @@
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from .jobs import job_status
+from .models import Job
 
 # Create your views here.
+
+
+@login_required(login_url="/login/")
+def job(request, job_id):
+    job = get_object_or_404(Job, id=job_id)
+    return JsonResponse(job_status(job))
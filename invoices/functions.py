@@ -0,0 +1,280 @@
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import F, Sum, Case, When, Value, DecimalField, Prefetch, Exists, OuterRef
+from orders.models import Order, OrderElement
+from payments.models import Payment, PaymentElement
+from services.functions import next_number
+from common.rollups import apply_deltas, invoiced_by_order
+from common.fragments import FRAGMENT_SOURCES, invalidate
+from reports.rollups import apply_changes as apply_revenue_changes
+from .models import Invoice, InvoiceElement, Proforma, ProformaElement, OPEN_ITEMS
+
+# helping functions
+
+# The fields the invoice editors write. Invoice.payed is moved by common.rollups only,
+# a full save would write back the payed value read at the start of the request.
+EDITOR_FIELDS = ["value", "description", "serial", "number", "created_at", "deadline", "modified_by", "modified_at"]
+
+def invoice_values(invoice_ids):
+    """
+    The value of every invoice from its elements with one grouped query: {invoice_id: value}.
+    Every element counts, cancellation invoices are negative. The invoice editor and the order editor
+    both value invoices through this, so an invoice is worth the same whichever of them saved it last.
+    """
+    values = {}
+    for pk, cancellation_to_id, total in Invoice.objects.filter(id__in=invoice_ids).annotate(
+        total=Sum(F("invoiceelement__element__price") * F("invoiceelement__element__quantity"))
+    ).values_list("id", "cancellation_to_id", "total"):
+        values[pk] = -abs(total or 0) if cancellation_to_id else total or 0
+    return values
+
+def candidate_elements(elements):
+    """Loads what the editors show of an order element with the element itself."""
+    return elements.select_related("order__person", "order__currency", "service", "status", "um").order_by("id")
+
+def uninvoiced_order_elements(person):
+    """
+    The order elements of a person that were started and are on no invoice.
+    A NOT EXISTS anti-join on the element index of the invoice elements,
+    so it reads only the candidates instead of everything the person ever had invoiced.
+    """
+    return candidate_elements(
+        OrderElement.objects.filter(order__person=person, status__percent__gte=1).filter(
+            ~Exists(InvoiceElement.objects.filter(element=OuterRef("pk")))
+        )
+    )
+
+def unproformed_order_elements(person):
+    """The client order elements of a person that are on no invoice and no proforma (see uninvoiced_order_elements)."""
+    return candidate_elements(
+        OrderElement.objects.filter(
+            order__person=person, order__is_client=True, status__percent__gte=1, status__percent__lte=100
+        ).filter(
+            ~Exists(InvoiceElement.objects.filter(element=OuterRef("pk"))),
+            ~Exists(ProformaElement.objects.filter(element=OuterRef("pk"))),
+        )
+    )
+
+def element_orders(elements):
+    """The distinct orders of invoice or proforma elements, in the order of the elements."""
+    orders = {}
+    for e in elements:
+        orders.setdefault(e.element.order_id, e.element.order)
+    return list(orders.values())
+
+def annotate_invoices(invoices):
+    """
+    Adds the paid percent of every invoice as an SQL annotation and prefetches the elements
+    with their orders and the proformas, so a page of invoices is loaded with a fixed number of queries.
+    """
+    return invoices.select_related(
+        "person", "modified_by", "currency"
+    ).annotate(
+        payed_percent=Case(
+            When(value=0, then=Value(0)),
+            default=F("payed") * 100 / F("value"),
+            output_field=DecimalField(),
+        ),
+    ).prefetch_related(
+        Prefetch(
+            "invoiceelement_set",
+            queryset=InvoiceElement.objects.select_related("element__order__person").order_by("id"),
+            to_attr="elements",
+        ),
+        Prefetch("proforma_set", queryset=Proforma.objects.order_by("id"), to_attr="proformas"),
+    )
+
+def invoice_rows(invoices):
+    """Builds the template rows for annotated invoices (see annotate_invoices)."""
+    return [
+        {
+            "invoice": i,
+            "payed": int(i.payed_percent or 0),
+            "value": i.value,
+            "orders": element_orders(i.elements),
+            "proforma": i.proformas[0] if i.proformas else None,
+        }
+        for i in invoices
+    ]
+
+def annotate_proformas(proformas):
+    """Prefetches the elements of every proforma with their orders (see annotate_invoices)."""
+    return proformas.select_related(
+        "person", "modified_by", "currency", "invoice"
+    ).prefetch_related(
+        Prefetch(
+            "proformaelement_set",
+            queryset=ProformaElement.objects.select_related("element__order__person").order_by("id"),
+            to_attr="elements",
+        ),
+    )
+
+def proforma_rows(proformas):
+    """Builds the template rows for annotated proformas (see annotate_proformas)."""
+    return [
+        {"proforma": p, "value": p.value, "orders": element_orders(p.elements)}
+        for p in proformas
+    ]
+
+def cancel_payment(cancelled_invoice, cancellation_invoice, user):
+    """Creates the storno payment of a cancellation invoice, and the cancelled payment if there was none."""
+    # Căutăm o plată existentă asociată facturii anulate
+    cancelled_payment = Payment.objects.filter(
+        person=cancelled_invoice.person_id,
+        is_client=cancelled_invoice.is_client,
+        currency=cancelled_invoice.currency_id
+    ).first()
+
+    # Dacă nu există, creăm un nou obiect Payment
+    if not cancelled_payment:
+        cancelled_payment = Payment(
+            person_id=cancelled_invoice.person_id,
+            is_client=cancelled_invoice.is_client,
+            modified_by=user,
+            created_by=user,
+            currency_id=cancelled_invoice.currency_id,
+            value=cancelled_invoice.value,
+            description="Stornierte Zahlung"
+        )
+        cancelled_payment.save()
+        PaymentElement.objects.create(payment=cancelled_payment, invoice=cancelled_invoice)
+
+    if cancelled_payment.type == "cash":
+        p_serial, p_number = next_number("receipt")
+    else:
+        p_serial = ""
+        p_number = ""
+
+    cancellation_payment = Payment(
+        serial = p_serial,
+        number = p_number,
+        person_id = cancellation_invoice.person_id,
+        is_client = cancellation_invoice.is_client,
+        modified_by = user,
+        created_by = user,
+        currency_id = cancellation_invoice.currency_id,
+        value = - cancelled_payment.value,
+        description = "Stornozahlung",
+        type = cancelled_payment.type,
+        cancellation_to = cancelled_payment,
+    )
+    cancellation_payment.save()
+    PaymentElement.objects.create(payment=cancellation_payment, invoice=cancellation_invoice)
+    # Making the payments connected
+    cancelled_payment.cancellation_to = cancellation_payment
+    cancelled_payment.save(update_fields=["cancellation_to"])
+
+def cancel_invoices(invoices, user):
+    """
+    Cancels the invoices in one transaction and returns their cancellation invoices.
+    Invoices that are cancelled or cancellations themselves are skipped, the rows are locked first
+    so a second request cannot cancel the same invoice twice.
+    The cancellation invoices and their elements are written with bulk_create, so the rollups
+    the signals would keep (Order.invoiced, the revenue days, the dashboard boxes) are updated here,
+    the invoiced value of all affected orders with a single UPDATE.
+    """
+    with transaction.atomic():
+        cancelled_invoices = list(
+            Invoice.objects.select_for_update().filter(
+                id__in=invoices.values("id"),
+                cancelled_from__isnull=True,
+                cancellation_to__isnull=True,
+            ).order_by("id")
+        )
+        if not cancelled_invoices:
+            return []
+
+        cancellation_invoices = []
+        for cancelled_invoice in cancelled_invoices:
+            # The numbers are reserved in the same transaction as the documents, so the series stay gapless
+            invoice_serial, invoice_number = next_number("invoice")
+            cancellation_invoices.append(Invoice(
+                serial = invoice_serial,
+                number = invoice_number,
+                person_id = cancelled_invoice.person_id,
+                is_client = cancelled_invoice.is_client,
+                modified_by = user,
+                created_by = user,
+                currency_id = cancelled_invoice.currency_id,
+                cancellation_to = cancelled_invoice,
+                value = 0 - cancelled_invoice.value,
+                payed = 0 - cancelled_invoice.value,
+                description = "Stornorechnung"
+            ))
+        Invoice.objects.bulk_create(cancellation_invoices)
+
+        # The cancelled invoices stop counting as invoiced
+        cancelled_elements = InvoiceElement.objects.filter(invoice__in=cancelled_invoices)
+        apply_deltas(Order, "invoiced", {pk: -total for pk, total in invoiced_by_order(cancelled_elements).items()})
+
+        date_now = timezone.now()
+        for cancelled_invoice, cancellation_invoice in zip(cancelled_invoices, cancellation_invoices):
+            cancelled_invoice.cancelled_from = cancellation_invoice
+            cancelled_invoice.modified_at = date_now  # a new version for common.printing
+        Invoice.objects.bulk_update(cancelled_invoices, ["cancelled_from", "modified_at"])
+
+        cancellation_by_invoice = {i.cancellation_to_id: i for i in cancellation_invoices}
+        InvoiceElement.objects.bulk_create(
+            InvoiceElement(invoice=cancellation_by_invoice[e.invoice_id], element_id=e.element_id)
+            for e in cancelled_elements.order_by("id")
+        )
+
+        for cancelled_invoice, cancellation_invoice in zip(cancelled_invoices, cancellation_invoices):
+            cancel_payment(cancelled_invoice, cancellation_invoice, user)
+
+        apply_revenue_changes(cancellation_invoices)
+        invalidate(FRAGMENT_SOURCES[Invoice])
+    return cancellation_invoices
+
+def open_items():
+    """The unpaid invoices, served by the open items partial indexes instead of summing every payment."""
+    return Invoice.objects.filter(OPEN_ITEMS)
+
+def invoice_print(invoice):
+    """Returns the template, context and file name for printing an invoice (see common.printing)."""
+    invoice_elements = InvoiceElement.objects.exclude(element__status__id='6').filter(invoice=invoice).order_by("id")
+    date1 = invoice.created_at.date()
+    date2 = invoice.deadline
+    day_left = (date2 - date1).days
+    leading_invoice = invoice.number.rjust(4,'0')
+    try:
+        proforma = Proforma.objects.get(invoice=invoice)
+        proforma_number = proforma.number
+    except:
+        proforma = ""
+        proforma_number = ""
+    leading_proforma = proforma_number.rjust(4,'0')
+
+    context = {
+        "invoice": invoice,
+        "proforma": proforma,
+        "day_left": day_left,
+        "leading_invoice": leading_invoice,
+        "leading_proforma": leading_proforma,
+        "invoice_elements": invoice_elements
+    }
+    return {
+        "template": "payments/print_invoice.html",
+        "context": context,
+        "filename": f"Rechnung-{invoice.serial}-{invoice.number}.pdf",
+        "immutable": invoice.is_client,  # issued invoices
+    }
+
+def cancellation_invoice_print(invoice):
+    """Returns the template, context and file name for printing a cancellation invoice."""
+    invoice_elements = InvoiceElement.objects.exclude(element__status__id='6').filter(invoice=invoice).order_by("id")
+    leading_storno = invoice.number.rjust(4,'0')
+    leading_invoice = invoice.cancellation_to.number.rjust(4,'0')
+
+    context = {
+        "invoice": invoice,
+        "leading_storno": leading_storno,
+        "leading_invoice": leading_invoice,
+        "invoice_elements": invoice_elements
+    }
+    return {
+        "template": "payments/print_cancellation_invoice.html",
+        "context": context,
+        "filename": f"Stornorechnung-{invoice.serial}-{invoice.number}.pdf",
+        "immutable": True,
+    }
@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from invoices.functions import cancel_invoices
+from invoices.models import Invoice
+
+
+class Command(BaseCommand):
+    help = 'Cancels invoices in one transaction, e.g. every open invoice of a voided client contract'
+
+    def add_arguments(self, parser):
+        parser.add_argument("invoices", nargs="*", type=int, help="Ids of the invoices to cancel.")
+        parser.add_argument("--person", type=int, help="Cancel every invoice of this person.")
+        parser.add_argument("--order", type=int, help="Cancel every invoice holding elements of this order.")
+        parser.add_argument("--user", help="Username recorded as the creator of the cancellations.")
+
+    def handle(self, *args, **options):
+        if not (options["invoices"] or options["person"] or options["order"]):
+            raise CommandError("Give invoice ids, --person or --order.")
+
+        invoices = Invoice.objects.all()
+        if options["invoices"]:
+            invoices = invoices.filter(id__in=options["invoices"])
+        if options["person"]:
+            invoices = invoices.filter(person_id=options["person"])
+        if options["order"]:
+            invoices = invoices.filter(invoiceelement__element__order_id=options["order"])
+
+        user = None
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(username=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        cancellations = cancel_invoices(invoices, user)
+        for invoice in cancellations:
+            self.stdout.write(f"{invoice.cancellation_to_id} cancelled by {invoice.serial}{invoice.number}")
+        self.stdout.write(self.style.SUCCESS(f"{len(cancellations)} invoices cancelled."))
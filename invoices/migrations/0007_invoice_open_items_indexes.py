@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-18 14:30
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoices", "0006_invoice_vat_rate_invoice_vat_value_proforma_vat_rate_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                condition=models.Q(
+                    ("cancellation_to__isnull", True),
+                    ("cancelled_from__isnull", True),
+                    ("payed__lt", django.db.models.expressions.F("value")),
+                ),
+                fields=["is_client", "-deadline"],
+                name="invoice_open_deadline_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                condition=models.Q(
+                    ("cancellation_to__isnull", True),
+                    ("cancelled_from__isnull", True),
+                    ("payed__lt", django.db.models.expressions.F("value")),
+                ),
+                fields=["person", "is_client"],
+                name="invoice_open_person_idx",
+            ),
+        ),
+    ]
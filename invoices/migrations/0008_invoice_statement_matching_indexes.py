@@ -0,0 +1,32 @@
+# Generated by Django 4.2.11 on 2026-10-18 16:20
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoices", "0007_invoice_open_items_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                django.db.models.expressions.CombinedExpression(
+                    django.db.models.expressions.F("value"), "-", django.db.models.expressions.F("payed")
+                ),
+                condition=models.Q(
+                    ("cancellation_to__isnull", True),
+                    ("cancelled_from__isnull", True),
+                    ("payed__lt", django.db.models.expressions.F("value")),
+                ),
+                name="invoice_open_balance_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(fields=["serial", "number"], name="invoice_serial_number_idx"),
+        ),
+    ]
@@ -8,6 +8,9 @@ from services.models import DocumentBase, Currency
 
 # Create your models here.
 
+# Invoices still waiting for payments, Invoice.payed is kept up to date by common.rollups.
+# Cancelled invoices and cancellation invoices are never open.
+OPEN_ITEMS = models.Q(payed__lt=models.F("value"), cancelled_from__isnull=True, cancellation_to__isnull=True)
 
 class Invoice(DocumentBase):
     deadline = models.DateField(default=timezone.now)
@@ -16,6 +19,16 @@ class Invoice(DocumentBase):
     is_recurrent = models.BooleanField(default=False)
     payed = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    class Meta:
+        # Partial indexes: listing open items reads only the open invoices
+        indexes = [
+            models.Index(fields=["is_client", "-deadline"], condition=OPEN_ITEMS, name="invoice_open_deadline_idx"),
+            models.Index(fields=["person", "is_client"], condition=OPEN_ITEMS, name="invoice_open_person_idx"),
+            # Bank statement lines are matched by their open amount and by the invoice number they quote
+            models.Index(models.F("value") - models.F("payed"), condition=OPEN_ITEMS, name="invoice_open_balance_idx"),
+            models.Index(fields=["serial", "number"], name="invoice_serial_number_idx"),
+        ]
+
     def __str__(self):
         formatted_created_at = self.created_at.strftime("%d.%m.%Y %H:%M")
         return f"Invoice {self.serial}{self.number} from {formatted_created_at} - {self.person} - {self.description}"
@@ -1,3 +1,61 @@
+from decimal import Decimal
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from persons.models import Person
+from services.models import Status
+from users.models import CustomUser
+from orders.models import Order, OrderElement
+from payments.models import Payment, PaymentElement
+from .models import Invoice, InvoiceElement, Proforma, ProformaElement
 
-# Create your tests here.
+
+class ListQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Status.objects.create(id=1, name="In progress", percent=60)
+        cls.user = CustomUser.objects.create_user(
+            "anna", password="secret", first_name="Anna", profile_picture="profile_pictures/anna.jpg"
+        )
+        cls.person = Person.objects.create(firstname="Jonas", lastname="Weber")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def add_documents(self, count):
+        """An order with two elements on a proforma, its invoice and a payment of half of it."""
+        for _ in range(count):
+            order = Order.objects.create(person=self.person, value=Decimal("30.00"), modified_by=self.user)
+            elements = [
+                OrderElement.objects.create(order=order, quantity=2, price=Decimal("10.00")),
+                OrderElement.objects.create(order=order, quantity=1, price=Decimal("10.00")),
+            ]
+            invoice = Invoice.objects.create(person=self.person, value=Decimal("30.00"), modified_by=self.user)
+            proforma = Proforma.objects.create(
+                person=self.person, value=Decimal("30.00"), invoice=invoice, modified_by=self.user
+            )
+            for element in elements:
+                InvoiceElement.objects.create(invoice=invoice, element=element)
+                ProformaElement.objects.create(proforma=proforma, element=element)
+            payment = Payment.objects.create(person=self.person, value=Decimal("15.00"), modified_by=self.user)
+            PaymentElement.objects.create(payment=payment, invoice=invoice, value=Decimal("15.00"))
+
+    def assertConstantQueries(self, url):
+        # a page of 3 rows and a page of 8 rows (one page, see paginate_objects) load with as many queries
+        self.add_documents(3)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_documents(5)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_invoices_list(self):
+        response = self.assertConstantQueries("/payments/invoices/")
+        self.assertEqual(len(response.context["person_invoices"].object_list), 8)
+
+    def test_proformas_list(self):
+        response = self.assertConstantQueries("/payments/proformas/")
+        self.assertEqual(len(response.context["person_proformas"].object_list), 8)
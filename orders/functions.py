@@ -0,0 +1,82 @@
+from django.db.models import F, Sum, Case, When, Value, DecimalField, OuterRef, Subquery, Prefetch
+from invoices.models import Invoice, InvoiceElement, ProformaElement
+from django.utils import timezone
+from invoices.functions import invoice_values
+from common.rollups import refresh_order_invoiced
+from reports.rollups import apply_changes as apply_revenue_changes
+from .models import OrderElement
+
+# helping functions
+
+# The fields the order editors write. Order.invoiced is moved by common.rollups only,
+# a full save would write back the invoiced value read at the start of the request.
+EDITOR_FIELDS = ["person", "description", "status", "currency", "deadline", "value", "modified_by", "modified_at"]
+
+def annotate_orders(orders):
+    """
+    Adds the invoiced percent and the first proforma of every order as SQL annotations
+    and prefetches the elements, so only the rows that are fetched load their elements.
+    """
+    first_proforma = ProformaElement.objects.filter(
+        element__order=OuterRef("pk")
+    ).order_by("element_id", "id").values("proforma_id")[:1]
+
+    return orders.select_related(
+        "person", "modified_by", "status", "currency"
+    ).annotate(
+        invoiced_percent=Case(
+            When(value=0, then=Value(0)),
+            default=F("invoiced") * 100 / F("value"),
+            output_field=DecimalField(),
+        ),
+        proforma_id=Subquery(first_proforma),
+    ).prefetch_related(
+        Prefetch(
+            "orderelement_set",
+            queryset=OrderElement.objects.select_related("service", "status").order_by("id"),
+            to_attr="elements",
+        )
+    )
+
+def order_rows(orders):
+    """Builds the template rows for annotated orders (see annotate_orders)."""
+    return [
+        {
+            "order": o,
+            "elements": o.elements,
+            "invoiced": int(o.invoiced_percent or 0),
+            "proformed": o.proforma_id,
+        }
+        for o in orders
+    ]
+
+def update_order_value(order):
+    """
+    Saves the order value and, for client orders, revalues every invoice holding its elements
+    (see invoices.functions.invoice_values), writing the invoices back with a single bulk_update.
+    The invoices holding its elements are marked as modified, their printed PDFs are versioned by modified_at.
+    """
+    order.value = OrderElement.objects.filter(order=order).aggregate(
+        total=Sum(F("price") * F("quantity"))
+    )["total"] or 0
+    order.save(update_fields=EDITOR_FIELDS)
+    # Prices and quantities changed, so the invoiced value is recalculated instead of a delta
+    refresh_order_invoiced([order.id])
+    order.refresh_from_db(fields=["invoiced"])
+
+    invoices = list(Invoice.objects.filter(
+        id__in=InvoiceElement.objects.filter(element__order=order).values("invoice_id")
+    ))
+    date_now = timezone.now()
+    for invoice in invoices:
+        invoice.modified_at = date_now
+    if not order.is_client:
+        # provider invoices are valued in the invoice editor only
+        Invoice.objects.bulk_update(invoices, ["modified_at"])
+        return
+
+    values = invoice_values([invoice.id for invoice in invoices])
+    for invoice in invoices:
+        invoice.value = values[invoice.id]
+    Invoice.objects.bulk_update(invoices, ["value", "modified_at"])
+    apply_revenue_changes(invoices)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0006_offer_vat_rate_offer_vat_value_order_vat_rate_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["person", "is_client"], name="order_person_client_idx"),
+        ),
+    ]
@@ -12,6 +12,12 @@ class Order(DocumentBase):
     status = models.ForeignKey(Status, on_delete=models.SET_DEFAULT, default=1)
     invoiced = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    class Meta:
+        # The client and provider order counts of the person lists
+        indexes = [
+            models.Index(fields=["person", "is_client"], name="order_person_client_idx"),
+        ]
+
     def __str__(self):
         formatted_deadline = self.deadline.strftime("%d.%m.%Y %H:%M")
         return f"Order {self.serial}{self.number} - {self.person} - {formatted_deadline} - {self.description} ({self.value}{self.currency.symbol})"
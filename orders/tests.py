@@ -1,3 +1,84 @@
+from decimal import Decimal
 from django.test import TestCase
+from persons.models import Person
+from services.models import Status
+from invoices.models import Invoice, InvoiceElement
+from .models import Order, OrderElement
+from .functions import update_order_value
 
-# Create your tests here.
+
+class UpdateOrderValueTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.started = Status.objects.create(id=1, name="Started", percent=20)
+        cls.waiting = Status.objects.create(id=2, name="Waiting", percent=0)
+        cls.person = Person.objects.create(firstname="Anna", lastname="Schmidt")
+
+    def invoiced_order(self, is_client):
+        order = Order.objects.create(person=self.person, is_client=is_client)
+        elements = [
+            OrderElement.objects.create(order=order, quantity=2, price=Decimal("10.00"), status=self.started),
+            OrderElement.objects.create(order=order, quantity=1, price=Decimal("5.00"), status=self.waiting),
+        ]
+        invoice = Invoice.objects.create(person=self.person, is_client=is_client)
+        for element in elements:
+            InvoiceElement.objects.create(invoice=invoice, element=element)
+        return order, elements, invoice
+
+    def test_client_invoice_is_valued_like_the_invoice_editor(self):
+        order, elements, invoice = self.invoiced_order(is_client=True)
+        elements[0].price = Decimal("12.50")
+        elements[0].save()
+
+        update_order_value(order)
+
+        # every element counts, whatever its status (invoices.functions.invoice_values)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.value, Decimal("30.00"))
+        order.refresh_from_db()
+        self.assertEqual(order.value, Decimal("30.00"))
+
+    def test_cancellation_invoice_is_negative(self):
+        order, elements, invoice = self.invoiced_order(is_client=True)
+        cancellation = Invoice.objects.create(person=self.person, cancellation_to=invoice)
+        for element in elements:
+            InvoiceElement.objects.create(invoice=cancellation, element=element)
+
+        update_order_value(order)
+
+        cancellation.refresh_from_db()
+        self.assertEqual(cancellation.value, Decimal("-25.00"))
+
+    def test_provider_invoices_are_left_to_the_invoice_editor(self):
+        order, elements, invoice = self.invoiced_order(is_client=False)
+        Invoice.objects.filter(id=invoice.id).update(value=Decimal("99.00"))
+        elements[0].price = Decimal("12.50")
+        elements[0].save()
+
+        update_order_value(order)
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.value, Decimal("99.00"))
+
+    def test_invoices_get_a_new_print_version(self):
+        for is_client in (True, False):
+            order, elements, invoice = self.invoiced_order(is_client=is_client)
+            modified_at = invoice.modified_at
+
+            update_order_value(order)
+
+            # common.printing versions the PDFs of the invoices by modified_at
+            invoice.refresh_from_db()
+            self.assertGreater(invoice.modified_at, modified_at)
+
+    def test_invoiced_is_counted_in_the_database(self):
+        order, elements, invoice = self.invoiced_order(is_client=True)
+        # the editor's instance was loaded before the elements were invoiced
+        self.assertEqual(order.invoiced, 0)
+
+        update_order_value(order)
+
+        self.assertEqual(order.invoiced, Decimal("25.00"))
+        order.refresh_from_db()
+        self.assertEqual(order.invoiced, Decimal("25.00"))
@@ -1,20 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.template.loader import render_to_string
 from django.http import HttpResponse
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.db.models import Q
 from .models import Order, OrderElement, Offer, OfferElement
 from persons.models import Person
+from persons.functions import search_persons
 from invoices.models import Invoice, InvoiceElement, ProformaElement
 from payments.models import Payment, PaymentElement
-from services.models import Currency, Status, Service, UM, Serial
+from services.models import Currency, Status, Service, UM
+from services.functions import next_number
 from django.core.paginator import Paginator
 from datetime import datetime, timedelta
 from django.utils.dateparse import parse_date
 from django.utils import timezone
-from weasyprint import HTML, CSS
-import base64
-from common.helpers import get_date_range, get_search_params, paginate_objects
+from common.helpers import get_date_range, get_search_params, paginate_objects, sort_objects
+from common.printing import print_document
+from .functions import annotate_orders, order_rows, update_order_value
 
 # Create your views here.
 
@@ -37,34 +39,23 @@ def c_orders(request):
         Q(person__company_name__icontains=search_client)
     )
 
-    # Prepare orders list with invoicing details
-    client_orders = []
-    for o in selected_orders:
-        order_elements = list(OrderElement.objects.filter(order=o).order_by("id"))
-        
-        # proformed = any(ProformaElement.objects.filter(element=e).exists() for e in order_elements)
-        proformed = next((ProformaElement.objects.filter(element=e).first() for e in order_elements if ProformaElement.objects.filter(element=e).exists()), None)
-        invoiced = int(o.invoiced / o.value * 100) if o.value else 0
-        
-        client_orders.append({"order": o, "elements": order_elements, "invoiced": invoiced, "proformed": proformed})
-    
     # Sorting logic
     sort_keys = {
-        "order": lambda x: x["order"].id,
-        "client": lambda x: x["order"].person.firstname,
-        "assignee": lambda x: x["order"].modified_by.first_name,
-        "registered": lambda x: x["order"].created_at,
-        "deadline": lambda x: x["order"].deadline,
-        "status": lambda x: x["order"].status.percent,
-        "value": lambda x: x["order"].value,
-        "invoiced": lambda x: x["invoiced"],
-        "update": lambda x: x["order"].modified_at,
+        "order": "id",
+        "client": "person__firstname",
+        "assignee": "modified_by__first_name",
+        "registered": "created_at",
+        "deadline": "deadline",
+        "status": "status__percent",
+        "value": "value",
+        "invoiced": "invoiced_percent",
+        "update": "modified_at",
     }
+    selected_orders = sort_objects(annotate_orders(selected_orders), sort, sort_keys, ascending=["client", "status"])
 
-    client_orders.sort(key=sort_keys.get(sort, lambda x: x["order"].created_at), reverse=(sort not in ["client", "status"]))
-    
     # Pagination
-    orders_on_page = paginate_objects(request, client_orders)
+    orders_on_page = paginate_objects(request, selected_orders)
+    orders_on_page.object_list = order_rows(orders_on_page.object_list)
 
     return render(
         request,
@@ -86,7 +77,6 @@ def c_order(request, order_id, client_id):
     currencies = Currency.objects.all().order_by("id")
     ums = UM.objects.all().order_by("id")
     services = Service.objects.all().order_by("name")
-    serials = Serial.objects.get(id=1)
     search = ""
     clients = []
     elements = []
@@ -98,90 +88,70 @@ def c_order(request, order_id, client_id):
         new = False
         order = get_object_or_404(Order, id=order_id)
         client = order.person
-        elements = OrderElement.objects.filter(order=order).order_by("id")
+        elements = OrderElement.objects.filter(order=order).select_related("service", "um", "status").order_by("id")
         is_invoiced = InvoiceElement.objects.filter(element__order=order).exists()
         is_proformed = ProformaElement.objects.filter(element__order=order).exists()
         if request.method == "POST":
-            if "search" in request.POST:
-                search = request.POST.get("search")
-                if len(search) > 3:
-                    clients = Person.objects.filter(
-                        Q(firstname__icontains=search)
-                        | Q(lastname__icontains=search)
-                        | Q(company_name__icontains=search)
-                    )
-            if "new_client" in request.POST and is_invoiced == False:
-                new_client = request.POST.get("new_client")
-                client = get_object_or_404(Person, id=new_client)
-                order.person = client
-                order.modified_at = date_now
-            if "order_description" in request.POST:
-                order.description = request.POST.get("order_description")
-                order.status = Status.objects.get(id=request.POST.get("order_status"))
-                for e in elements:
-                    e.status = order.status
-                    e.save()
-                order.currency = currencies[int(request.POST.get("order_currency")) - 1]
-                deadline_date = request.POST.get("deadline_date")
-                deadline_time = request.POST.get("deadline_time")
-                try:
-                    deadline_naive = datetime.strptime(f"{deadline_date} {deadline_time}", "%Y-%m-%d %H:%M")
-                    order.deadline = timezone.make_aware(deadline_naive)
-                except:
-                    order.deadline = date_now
-            if "element_id" in request.POST:
-                element_id = int(request.POST.get("element_id"))
-                if element_id > 0:  # edit an element
+            with transaction.atomic():
+                if "search" in request.POST:
+                    search = request.POST.get("search")
+                    if len(search) > 3:
+                        clients = search_persons(search, "client")[:30]
+                if "new_client" in request.POST and is_invoiced == False:
+                    new_client = request.POST.get("new_client")
+                    client = get_object_or_404(Person, id=new_client)
+                    order.person = client
+                    order.modified_at = date_now
+                if "order_description" in request.POST:
+                    order.description = request.POST.get("order_description")
+                    order.status = Status.objects.get(id=request.POST.get("order_status"))
+                    elements.update(status=order.status)
+                    order.currency = currencies[int(request.POST.get("order_currency")) - 1]
+                    deadline_date = request.POST.get("deadline_date")
+                    deadline_time = request.POST.get("deadline_time")
+                    try:
+                        deadline_naive = datetime.strptime(f"{deadline_date} {deadline_time}", "%Y-%m-%d %H:%M")
+                        order.deadline = timezone.make_aware(deadline_naive)
+                    except:
+                        order.deadline = date_now
+                if "element_id" in request.POST:
+                    element_id = int(request.POST.get("element_id"))
+                    if element_id > 0:  # edit an element
+                        element = OrderElement.objects.get(id=element_id)
+                    else:  # add an element to order
+                        element = OrderElement(order=order)
+                    service_id = int(request.POST.get("e_service"))
+                    element.service = Service.objects.get(id=service_id)
+                    element.description = request.POST.get("e_description")
+                    e_quantity = request.POST.get("e_quantity")
+                    if e_quantity and e_quantity.replace(".", "").isdigit():
+                        element.quantity = float(e_quantity)
+                    else:
+                        element.quantity = float(1.0)
+                    element.um = ums[int(request.POST.get("e_um")) - 1]
+                    e_price = request.POST.get("e_price")
+                    if e_price and e_price.replace(".", "").isdigit():
+                        element.price = float(e_price)
+                    else:
+                        element.price = float(1.0)
+                    element.status = Status.objects.get(id=int(request.POST.get("e_status")))
+                    element.save()
+                    # setting order status to minimum form elements
+                    status_elements = sorted(elements, key=lambda x: x.status.percent)
+                    order.status = status_elements[0].status
+                    element = ""  # clearing the active element
+                if "delete_element_id" in request.POST:  # delete en element
+                    element_id = int(request.POST.get("delete_element_id"))
                     element = OrderElement.objects.get(id=element_id)
-                else:  # add an element to order
-                    element = OrderElement(order=order)
-                service_id = int(request.POST.get("e_service"))
-                element.service = Service.objects.get(id=service_id)
-                element.description = request.POST.get("e_description")
-                e_quantity = request.POST.get("e_quantity")
-                if e_quantity and e_quantity.replace(".", "").isdigit():
-                    element.quantity = float(e_quantity)
-                else:
-                    element.quantity = float(1.0)
-                element.um = ums[int(request.POST.get("e_um")) - 1]
-                e_price = request.POST.get("e_price")
-                if e_price and e_price.replace(".", "").isdigit():
-                    element.price = float(e_price)
-                else:
-                    element.price = float(1.0)
-                element.status = Status.objects.get(id=int(request.POST.get("e_status")))
-                element.save()
-                # setting order status to minimum form elements
-                status_elements = sorted(elements, key=lambda x: x.status.percent)
-                order.status = status_elements[0].status
-                element = ""  # clearing the active element
-            if "delete_element_id" in request.POST:  # delete en element
-                element_id = int(request.POST.get("delete_element_id"))
-                element = OrderElement.objects.get(id=element_id)
-                element.delete()
-            if "edit_element_id" in request.POST:  # set an element editable in template
-                element_id = int(request.POST.get("edit_element_id"))
-                element = OrderElement.objects.get(id=element_id)
-            # Setting the modiffied user and date
-            order.modified_by = request.user
-            order.modified_at = date_now
-            # Calculating the order value
-            order.value = 0
-            for e in elements:
-                order.value += (e.price * e.quantity)
-                try:
-                    # Calculating the invoice value if element is invoiced
-                    invoice_element = InvoiceElement.objects.get(element=e)
-                    invoice = invoice_element.invoice
-                    invoice_elements = InvoiceElement.objects.filter(invoice=invoice)
-                    invoice.value = 0
-                    for ie in invoice_elements:
-                        if ie.element.status.percent > 0:
-                            invoice.value += (ie.element.price * ie.element.quantity)
-                    invoice.save()
-                except:
-                    invoice = ""
-            order.save()
+                    element.delete()
+                if "edit_element_id" in request.POST:  # set an element editable in template
+                    element_id = int(request.POST.get("edit_element_id"))
+                    element = OrderElement.objects.get(id=element_id)
+                # Setting the modiffied user and date
+                order.modified_by = request.user
+                order.modified_at = date_now
+                # Calculating the order value and the value of its invoices
+                update_order_value(order)
 
     else:  # if order is new
         new = True
@@ -191,54 +161,50 @@ def c_order(request, order_id, client_id):
             client = ""
         order = ""
         if request.method == "POST":
-            if "search" in request.POST:
-                search = request.POST.get("search")
-                if len(search) > 3:
-                    clients = Person.objects.filter(
-                        Q(firstname__icontains=search)
-                        | Q(lastname__icontains=search)
-                        | Q(company_name__icontains=search)
+            with transaction.atomic():
+                if "search" in request.POST:
+                    search = request.POST.get("search")
+                    if len(search) > 3:
+                        clients = search_persons(search, "client")[:30]
+                if "new_client" in request.POST:
+                    new_client = request.POST.get("new_client")
+                    client = get_object_or_404(Person, id=new_client)
+                    return redirect(
+                        "c_order",
+                        order_id = 0,
+                        client_id = client.id
+                    )
+                if "order_description" in request.POST:
+                    description = request.POST.get("order_description")
+                    status = Status.objects.get(id=request.POST.get("order_status"))
+                    currency = currencies[int(request.POST.get("order_currency")) - 1]
+                    deadline_date = request.POST.get("deadline_date")
+                    deadline_time = request.POST.get("deadline_time")
+                    try:
+                        deadline_naive = datetime.strptime(f"{deadline_date} {deadline_time}", "%Y-%m-%d %H:%M")
+                        deadline = timezone.make_aware(deadline_naive)
+                    except:
+                        deadline = date_now 
+                    serial, number = next_number("order")
+                    order = Order(
+                        description = description,
+                        serial = serial,
+                        number = number,
+                        person=client,
+                        deadline=deadline,
+                        is_client=True,
+                        modified_by=request.user,
+                        created_by=request.user,
+                        status=status,
+                        currency=currency,
+                    )
+                    order.save()
+                    new = False
+                    return redirect(
+                        "c_order",
+                        order_id = order.id,
+                        client_id = client.id
                     )
-            if "new_client" in request.POST:
-                new_client = request.POST.get("new_client")
-                client = get_object_or_404(Person, id=new_client)
-                return redirect(
-                    "c_order",
-                    order_id = 0,
-                    client_id = client.id
-                )
-            if "order_description" in request.POST:
-                description = request.POST.get("order_description")
-                status = Status.objects.get(id=request.POST.get("order_status"))
-                currency = currencies[int(request.POST.get("order_currency")) - 1]
-                deadline_date = request.POST.get("deadline_date")
-                deadline_time = request.POST.get("deadline_time")
-                try:
-                    deadline_naive = datetime.strptime(f"{deadline_date} {deadline_time}", "%Y-%m-%d %H:%M")
-                    deadline = timezone.make_aware(deadline_naive)
-                except:
-                    deadline = date_now 
-                order = Order(
-                    description = description,
-                    serial = serials.order_serial,
-                    number = serials.order_number,
-                    person=client,
-                    deadline=deadline,
-                    is_client=True,
-                    modified_by=request.user,
-                    created_by=request.user,
-                    status=status,
-                    currency=currency,
-                )
-                order.save()
-                serials.order_number += 1
-                serials.save()
-                new = False
-                return redirect(
-                    "c_order",
-                    order_id = order.id,
-                    client_id = client.id
-                )
 
     return render(
         request,
@@ -319,7 +285,6 @@ def c_offer(request, offer_id, client_id):
     currencies = Currency.objects.all().order_by("id")
     ums = UM.objects.all().order_by("id")
     services = Service.objects.all().order_by("name")
-    serials = Serial.objects.get(id=1)
     search = ""
     clients = []
     elements = []
@@ -334,11 +299,7 @@ def c_offer(request, offer_id, client_id):
             if "search" in request.POST:
                 search = request.POST.get("search")
                 if len(search) > 3:
-                    clients = Person.objects.filter(
-                        Q(firstname__icontains=search)
-                        | Q(lastname__icontains=search)
-                        | Q(company_name__icontains=search)
-                    )
+                    clients = search_persons(search, "client")[:30]
             if "new_client" in request.POST:
                 new_client = request.POST.get("new_client")
                 client = get_object_or_404(Person, id=new_client)
@@ -407,11 +368,7 @@ def c_offer(request, offer_id, client_id):
             if "search" in request.POST:
                 search = request.POST.get("search")
                 if len(search) > 3:
-                    clients = Person.objects.filter(
-                        Q(firstname__icontains=search)
-                        | Q(lastname__icontains=search)
-                        | Q(company_name__icontains=search)
-                    )
+                    clients = search_persons(search, "client")[:30]
             if "new_client" in request.POST:
                 new_client = request.POST.get("new_client")
                 client = get_object_or_404(Person, id=new_client)
@@ -433,20 +390,20 @@ def c_offer(request, offer_id, client_id):
                 except:
                     deadline = date_now
                     print ("NUUUUUUUUUUUU NOU")
-                offer = Offer(
-                    description = description,
-                    serial = serials.offer_serial,
-                    number = serials.offer_number,
-                    person=client,
-                    deadline=deadline,
-                    modified_by=request.user,
-                    created_by=request.user,
-                    status=status,
-                    currency=currency,
-                )
-                offer.save()
-                serials.offer_number += 1
-                serials.save()
+                with transaction.atomic():
+                    serial, number = next_number("offer")
+                    offer = Offer(
+                        description = description,
+                        serial = serial,
+                        number = number,
+                        person=client,
+                        deadline=deadline,
+                        modified_by=request.user,
+                        created_by=request.user,
+                        status=status,
+                        currency=currency,
+                    )
+                    offer.save()
                 new = False
                 return redirect(
                     "c_offer",
@@ -475,36 +432,35 @@ def c_offer(request, offer_id, client_id):
 def convert_offer(request, offer_id):
     offer = get_object_or_404(Offer, id=offer_id)
     offer_elements = OfferElement.objects.filter(offer=offer).order_by("id")
-    serials = get_object_or_404(Serial, id=1)
     statuses = Status.objects.filter(id__range=(1,2)).order_by("id")
-    order = Order(
-        description = offer.description,
-        serial = serials.order_serial,
-        number = serials.order_number,
-        person= offer.person,
-        deadline= offer.deadline,
-        is_client=True,
-        modified_by= request.user,
-        created_by= request.user,
-        currency= offer.currency,
-        value= offer.value,
-    )
-    order.save()
-    for e in offer_elements:
-        element = OrderElement(
-            order=order,
-            service = e.service,
-            description = e.description,
-            quantity = e.quantity,
-            um = e.um,
-            price = e.price
+    with transaction.atomic():
+        serial, number = next_number("order")
+        order = Order(
+            description = offer.description,
+            serial = serial,
+            number = number,
+            person= offer.person,
+            deadline= offer.deadline,
+            is_client=True,
+            modified_by= request.user,
+            created_by= request.user,
+            currency= offer.currency,
+            value= offer.value,
         )
-        element.save()
-    offer.order = order
-    offer.status = statuses[1]
-    offer.save()
-    serials.order_number += 1
-    serials.save()
+        order.save()
+        for e in offer_elements:
+            element = OrderElement(
+                order=order,
+                service = e.service,
+                description = e.description,
+                quantity = e.quantity,
+                um = e.um,
+                price = e.price
+            )
+            element.save()
+        offer.order = order
+        offer.status = statuses[1]
+        offer.save()
 
     return redirect(
         "c_order",
@@ -531,31 +487,23 @@ def p_orders(request):
         Q(person__company_name__icontains=search_provider)
     )
 
-    # Prepare orders list with invoicing details
-    provider_orders = []
-    for o in selected_orders:
-        order_elements = list(OrderElement.objects.filter(order=o).order_by("id"))
-        invoiced = int(o.invoiced / o.value * 100) if o.value else 0
-        
-        provider_orders.append({"order": o, "elements": order_elements, "invoiced": invoiced})
-    
     # Sorting logic
     sort_keys = {
-        "order": lambda x: x["order"].id,
-        "provider": lambda x: x["order"].person.firstname,
-        "assignee": lambda x: x["order"].modified_by.first_name,
-        "registered": lambda x: x["order"].created_at,
-        "deadline": lambda x: x["order"].deadline,
-        "status": lambda x: x["order"].status.percent,
-        "value": lambda x: x["order"].value,
-        "invoiced": lambda x: x["invoiced"],
-        "update": lambda x: x["order"].modified_at,
+        "order": "id",
+        "provider": "person__firstname",
+        "assignee": "modified_by__first_name",
+        "registered": "created_at",
+        "deadline": "deadline",
+        "status": "status__percent",
+        "value": "value",
+        "invoiced": "invoiced_percent",
+        "update": "modified_at",
     }
+    selected_orders = sort_objects(annotate_orders(selected_orders), sort, sort_keys, ascending=["provider", "status"])
 
-    provider_orders.sort(key=sort_keys.get(sort, lambda x: x["order"].created_at), reverse=(sort not in ["provider", "status"]))
-    
     # Pagination
-    orders_on_page = paginate_objects(request, provider_orders)
+    orders_on_page = paginate_objects(request, selected_orders)
+    orders_on_page.object_list = order_rows(orders_on_page.object_list)
 
     return render(
         request,
@@ -644,7 +592,6 @@ def p_order(request, order_id, provider_id):
     currencies = Currency.objects.all().order_by("id")
     ums = UM.objects.all().order_by("id")
     services = Service.objects.all().order_by("name")
-    serials = Serial.objects.get(id=1)
     search = ""
     providers = []
     elements = []
@@ -655,78 +602,70 @@ def p_order(request, order_id, provider_id):
         new = False
         order = get_object_or_404(Order, id=order_id)
         provider = order.person
-        elements = OrderElement.objects.filter(order=order).order_by("id")
+        elements = OrderElement.objects.filter(order=order).select_related("service", "um", "status").order_by("id")
         is_invoiced = InvoiceElement.objects.filter(element__order=order).exists()
         if request.method == "POST":
-            if "search" in request.POST:
-                search = request.POST.get("search")
-                if len(search) > 3:
-                    providers = Person.objects.filter(
-                        Q(firstname__icontains=search)
-                        | Q(lastname__icontains=search)
-                        | Q(company_name__icontains=search)
-                    )
-            if "new_provider" in request.POST and is_invoiced == False:
-                new_provider = request.POST.get("new_provider")
-                provider = get_object_or_404(Person, id=new_provider)
-                order.person = provider
-                order.modified_at = date_now
-
-            if "order_description" in request.POST:
-                order.description = request.POST.get("order_description")
-                order.status = Status.objects.get(id=request.POST.get("order_status"))
-                for e in elements:
-                    e.status = order.status
-                    e.save()
-                order.currency = currencies[int(request.POST.get("order_currency")) - 1]
-                deadline_date = request.POST.get("deadline_date")
-                deadline_time = request.POST.get("deadline_time")
-                try:
-                    deadline_naive = datetime.strptime(f"{deadline_date} {deadline_time}", "%Y-%m-%d %H:%M")
-                    order.deadline = timezone.make_aware(deadline_naive)
-                except:
-                    order.deadline = date_now 
-            if "element_id" in request.POST:
-                element_id = int(request.POST.get("element_id"))
-                if element_id > 0:  # edit an element
+            with transaction.atomic():
+                if "search" in request.POST:
+                    search = request.POST.get("search")
+                    if len(search) > 3:
+                        providers = search_persons(search, "provider")[:30]
+                if "new_provider" in request.POST and is_invoiced == False:
+                    new_provider = request.POST.get("new_provider")
+                    provider = get_object_or_404(Person, id=new_provider)
+                    order.person = provider
+                    order.modified_at = date_now
+
+                if "order_description" in request.POST:
+                    order.description = request.POST.get("order_description")
+                    order.status = Status.objects.get(id=request.POST.get("order_status"))
+                    elements.update(status=order.status)
+                    order.currency = currencies[int(request.POST.get("order_currency")) - 1]
+                    deadline_date = request.POST.get("deadline_date")
+                    deadline_time = request.POST.get("deadline_time")
+                    try:
+                        deadline_naive = datetime.strptime(f"{deadline_date} {deadline_time}", "%Y-%m-%d %H:%M")
+                        order.deadline = timezone.make_aware(deadline_naive)
+                    except:
+                        order.deadline = date_now 
+                if "element_id" in request.POST:
+                    element_id = int(request.POST.get("element_id"))
+                    if element_id > 0:  # edit an element
+                        element = OrderElement.objects.get(id=element_id)
+                    else:  # add an element to order
+                        element = OrderElement(order=order)
+                    service_id = int(request.POST.get("e_service"))
+                    element.service = Service.objects.get(id=service_id)
+                    element.description = request.POST.get("e_description")
+                    e_quantity = request.POST.get("e_quantity")
+                    if e_quantity and e_quantity.replace(".", "").isdigit():
+                        element.quantity = float(e_quantity)
+                    else:
+                        element.quantity = float(1.0)
+                    element.um = ums[int(request.POST.get("e_um")) - 1]
+                    e_price = request.POST.get("e_price")
+                    if e_price and e_price.replace(".", "").isdigit():
+                        element.price = float(e_price)
+                    else:
+                        element.price = float(1.0)
+                    element.status = Status.objects.get(id=int(request.POST.get("e_status")))
+                    element.save()
+                    # setting order status to minimum form elements
+                    status_elements = sorted(elements, key=lambda x: x.status.percent)
+                    order.status = status_elements[0].status
+                    element = ""  # clearing the active element
+                if "delete_element_id" in request.POST:  # delete en element
+                    element_id = int(request.POST.get("delete_element_id"))
                     element = OrderElement.objects.get(id=element_id)
-                else:  # add an element to order
-                    element = OrderElement(order=order)
-                service_id = int(request.POST.get("e_service"))
-                element.service = Service.objects.get(id=service_id)
-                element.description = request.POST.get("e_description")
-                e_quantity = request.POST.get("e_quantity")
-                if e_quantity and e_quantity.replace(".", "").isdigit():
-                    element.quantity = float(e_quantity)
-                else:
-                    element.quantity = float(1.0)
-                element.um = ums[int(request.POST.get("e_um")) - 1]
-                e_price = request.POST.get("e_price")
-                if e_price and e_price.replace(".", "").isdigit():
-                    element.price = float(e_price)
-                else:
-                    element.price = float(1.0)
-                element.status = Status.objects.get(id=int(request.POST.get("e_status")))
-                element.save()
-                # setting order status to minimum form elements
-                status_elements = sorted(elements, key=lambda x: x.status.percent)
-                order.status = status_elements[0].status
-                element = ""  # clearing the active element
-            if "delete_element_id" in request.POST:  # delete en element
-                element_id = int(request.POST.get("delete_element_id"))
-                element = OrderElement.objects.get(id=element_id)
-                element.delete()
-            if "edit_element_id" in request.POST:  # set an element editable in template
-                element_id = int(request.POST.get("edit_element_id"))
-                element = OrderElement.objects.get(id=element_id)
-            # Setting the modiffied user and date
-            order.modified_by = request.user
-            order.modified_at = date_now
-            # Calculating the order value
-            order.value = 0
-            for e in elements:
-                order.value += (e.price * e.quantity)
-            order.save()
+                    element.delete()
+                if "edit_element_id" in request.POST:  # set an element editable in template
+                    element_id = int(request.POST.get("edit_element_id"))
+                    element = OrderElement.objects.get(id=element_id)
+                # Setting the modiffied user and date
+                order.modified_by = request.user
+                order.modified_at = date_now
+                # Calculating the order value and the value of its invoices
+                update_order_value(order)
 
     else:  # if order is new
         new = True
@@ -736,54 +675,50 @@ def p_order(request, order_id, provider_id):
             provider = ""
         order = ""
         if request.method == "POST":
-            if "search" in request.POST:
-                search = request.POST.get("search")
-                if len(search) > 3:
-                    providers = Person.objects.filter(
-                        Q(firstname__icontains=search)
-                        | Q(lastname__icontains=search)
-                        | Q(company_name__icontains=search)
+            with transaction.atomic():
+                if "search" in request.POST:
+                    search = request.POST.get("search")
+                    if len(search) > 3:
+                        providers = search_persons(search, "provider")[:30]
+                if "new_provider" in request.POST:
+                    new_provider = request.POST.get("new_provider")
+                    provider = get_object_or_404(Person, id=new_provider)
+                    return redirect(
+                        "p_order",
+                        order_id = 0,
+                        provider_id = provider.id
+                    )
+                if "order_description" in request.POST:
+                    description = request.POST.get("order_description")
+                    status = Status.objects.get(id=request.POST.get("order_status"))
+                    currency = currencies[int(request.POST.get("order_currency")) - 1]
+                    deadline_date = request.POST.get("deadline_date")
+                    deadline_time = request.POST.get("deadline_time")
+                    try:
+                        deadline_naive = datetime.strptime(f"{deadline_date} {deadline_time}", "%Y-%m-%d %H:%M")
+                        deadline = timezone.make_aware(deadline_naive)
+                    except:
+                        deadline = date_now 
+                    serial, number = next_number("p_order")
+                    order = Order(
+                        description = description,
+                        serial = serial,
+                        number = number,
+                        person=provider,
+                        deadline=deadline,
+                        is_client=False,
+                        modified_by=request.user,
+                        created_by=request.user,
+                        status=status,
+                        currency=currency,
+                    )
+                    order.save()
+                    new = False
+                    return redirect(
+                        "p_order",
+                        order_id = order.id,
+                        provider_id = provider.id
                     )
-            if "new_provider" in request.POST:
-                new_provider = request.POST.get("new_provider")
-                provider = get_object_or_404(Person, id=new_provider)
-                return redirect(
-                    "p_order",
-                    order_id = 0,
-                    provider_id = provider.id
-                )
-            if "order_description" in request.POST:
-                description = request.POST.get("order_description")
-                status = Status.objects.get(id=request.POST.get("order_status"))
-                currency = currencies[int(request.POST.get("order_currency")) - 1]
-                deadline_date = request.POST.get("deadline_date")
-                deadline_time = request.POST.get("deadline_time")
-                try:
-                    deadline_naive = datetime.strptime(f"{deadline_date} {deadline_time}", "%Y-%m-%d %H:%M")
-                    deadline = timezone.make_aware(deadline_naive)
-                except:
-                    deadline = date_now 
-                order = Order(
-                    description = description,
-                    serial = serials.p_order_serial,
-                    number = serials.p_order_number,
-                    person=provider,
-                    deadline=deadline,
-                    is_client=False,
-                    modified_by=request.user,
-                    created_by=request.user,
-                    status=status,
-                    currency=currency,
-                )
-                order.save()
-                serials.p_order_number += 1
-                serials.save()
-                new = False
-                return redirect(
-                    "p_order",
-                    order_id = order.id,
-                    provider_id = provider.id
-                )
 
     return render(
         request,
@@ -809,27 +744,12 @@ def print_order(request, order_id):
     order_elements = OrderElement.objects.exclude(status__id='6').filter(order=order).order_by("id")
     leading_number = str(order.number).rjust(4,'0')
 
-    # Open the logo image
-    with open('static/images/logo-se.jpeg', 'rb') as f:
-        img_content = f.read()
-    # Encode the image în base64
-    logo_base64 = base64.b64encode(img_content).decode('utf-8')
-    # Open the CSS content
-    with open('static/css/invoice.css', 'rb') as f:
-        order_content = f.read()
-
     context = {
         "order": order,
         "leading_number": leading_number,
-        "order_elements": order_elements,
-        "logo_base64": logo_base64
+        "order_elements": order_elements
     }
-    html_content = render_to_string("orders/print_order.html", context)
-
-    pdf_file = HTML(string=html_content).write_pdf(stylesheets=[CSS(string=order_content)])
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    response['Content-Disposition'] = f'filename=Auftragsbestaetigung_{order.serial}-{order.number}.pdf'
-    return response
+    return print_document(request, order, "orders/print_order.html", context, f"Auftragsbestaetigung_{order.serial}-{order.number}.pdf")
 
 @login_required(login_url="/login/")
 def print_offer(request, offer_id):
@@ -837,24 +757,9 @@ def print_offer(request, offer_id):
     offer_elements = OfferElement.objects.filter(offer=offer).order_by("id")
     leading_number = str(offer.number).rjust(4,'0')
 
-    # Open the logo image
-    with open('static/images/logo-se.jpeg', 'rb') as f:
-        img_content = f.read()
-    # Encode the image în base64
-    logo_base64 = base64.b64encode(img_content).decode('utf-8')
-    # Open the CSS content
-    with open('static/css/invoice.css', 'rb') as f:
-        offer_content = f.read()
-
     context = {
         "offer": offer,
         "leading_number": leading_number,
-        "offer_elements": offer_elements,
-        "logo_base64": logo_base64
+        "offer_elements": offer_elements
     }
-    html_content = render_to_string("orders/print_offer.html", context)
-
-    pdf_file = HTML(string=html_content).write_pdf(stylesheets=[CSS(string=offer_content)])
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    response['Content-Disposition'] = f'filename=Angebot_{offer.serial}-{offer.number}.pdf'
-    return response
\ No newline at end of file
+    return print_document(request, offer, "orders/print_offer.html", context, f"Angebot_{offer.serial}-{offer.number}.pdf")
\ No newline at end of file
@@ -1,43 +1,102 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Q, Sum, F, Value, Prefetch
+from django.db.models.functions import Coalesce
+from invoices.models import Invoice
 from payments.models import PaymentElement
-from django.db.models import Q, Sum, F
+from common.rollups import apply_payment_element_changes
+from common.fragments import FRAGMENT_SOURCES, invalidate
 from datetime import datetime, timedelta
 from django.utils import timezone
+from num2words import num2words
+from services.functions import next_number, peek_number
 
 # helping functions
 
-def update_invoice_payed(invoice):
-    invoice.payed = PaymentElement.objects.filter(invoice=invoice).aggregate(
-        total=Sum("value")
-    )["total"] or 0
-    invoice.save()
-
-def set_payment_value(payment, value=None):
-    elements = PaymentElement.objects.filter(payment=payment).order_by("invoice__created_at")
-    invoices = set()
-
-    if len(elements) == 1 and value is not None:
-        e = elements.first()
-        total_payed = PaymentElement.objects.filter(invoice=e.invoice).exclude(payment=payment).aggregate(total=Sum("value"))["total"] or 0
-        remaining = e.invoice.value - total_payed
-        e.value = min(value, remaining) if value > 0 else -min(abs(value), remaining)
-        e.save()
-        payment.value = e.value
-        invoices.add(e.invoice)
-    else:
-        total = 0
-        for e in elements:
-            if e.value == 0:
-                total_payed = PaymentElement.objects.filter(invoice=e.invoice).exclude(payment=payment).aggregate(total=Sum("value"))["total"] or 0
-                remaining = e.invoice.value - total_payed
-                e.value = remaining
-                e.save()
-            total += e.value
-            invoices.add(e.invoice)
-        payment.value = total
-
-    payment.save()
-    for inv in invoices:
-        update_invoice_payed(inv)
+def annotate_payments(payments):
+    """Prefetches the elements of every payment with their invoices and persons (see invoices.functions.annotate_invoices)."""
+    return payments.select_related(
+        "person", "modified_by", "currency"
+    ).prefetch_related(
+        Prefetch(
+            "paymentelement_set",
+            queryset=PaymentElement.objects.select_related("invoice__person").order_by("id"),
+            to_attr="elements",
+        ),
+    )
+
+def payment_rows(payments):
+    """Builds the template rows for annotated payments (see annotate_payments)."""
+    return [{"payment": p, "payed": p.value, "invoices": p.elements} for p in payments]
+
+def outstanding_balances(invoice_ids, payment=None):
+    """
+    The open amount of every invoice, oldest invoice first, from one grouped query: [(invoice_id, balance)].
+    What the given payment already pays is not deducted, so it can be distributed again.
+    """
+    own = dict(
+        PaymentElement.objects.filter(payment=payment, invoice_id__in=invoice_ids).values_list("invoice_id", "value")
+    ) if payment else {}
+    invoices = Invoice.objects.filter(id__in=invoice_ids).annotate(
+        total_payed=Coalesce(Sum("paymentelement__value"), Value(Decimal(0)))
+    ).order_by("created_at", "id").values_list("id", "value", "total_payed")
+    return [(pk, value - (total_payed - own.get(pk, 0))) for pk, value, total_payed in invoices]
+
+def distribute(balances, amount):
+    """Spends an amount FIFO over [(invoice_id, balance)], each invoice getting at most its balance: {invoice_id: value}."""
+    values = {}
+    left = abs(amount)
+    for pk, balance in balances:
+        share = max(min(left, balance), 0)
+        left -= share
+        values[pk] = share if amount > 0 else -share
+    return values
+
+def allocate_payment(payment, invoices=(), amount=None, split=None):
+    """
+    Distributes a payment over its invoices and the given ones (invoices or ids) and returns its elements.
+    With an amount it is spent FIFO by invoice date, each invoice getting at most its open amount
+    (a negative amount reverses the same way). A split ({invoice_id: amount}) sets the amounts explicitly.
+    Without either, every unallocated element gets the open amount of its invoice.
+    The elements are written with bulk_create/bulk_update, Invoice.payed with a single UPDATE
+    (see common.rollups.apply_payment_element_changes).
+    """
+    with transaction.atomic():
+        elements = {e.invoice_id: e for e in PaymentElement.objects.filter(payment=payment)}
+        invoice_ids = set(elements) | {getattr(i, "id", i) for i in invoices} | set(split or ())
+        balances = outstanding_balances(invoice_ids, payment)
+
+        values = {}
+        if split is not None:
+            for pk, balance in balances:
+                requested = split.get(pk, elements[pk].value if pk in elements else 0)
+                values[pk] = min(requested, balance) if requested > 0 else -min(abs(requested), abs(balance))
+        elif amount is not None:
+            values = distribute(balances, amount)
+        else:
+            for pk, balance in balances:
+                values[pk] = elements[pk].value if pk in elements and elements[pk].value != 0 else balance
+
+        changed, created = [], []
+        for pk, value in values.items():
+            element = elements.get(pk)
+            if element is None:
+                element = elements[pk] = PaymentElement(payment=payment, invoice_id=pk, value=value)
+                created.append(element)
+            elif element.value != value:
+                element.value = value
+                changed.append(element)
+        PaymentElement.objects.bulk_update(changed, ["value"])
+        PaymentElement.objects.bulk_create(created)
+        # bulk writes send no signals, the rollups are followed here
+        apply_payment_element_changes(changed + created)
+        if changed or created:
+            invalidate(FRAGMENT_SOURCES[PaymentElement])
+            payment.modified_at = timezone.now()  # the printed receipt lists the elements
+
+        payment.value = sum(e.value for e in elements.values())
+        payment.save()
+    return list(elements.values())
 
 def parse_payment_date(posted_date, fallback_date):
     try:
@@ -46,16 +105,34 @@ def parse_payment_date(posted_date, fallback_date):
     except:
         return fallback_date
     
-def get_serial_and_number(is_client, payment_type, serials, assign=False):
+def get_serial_and_number(is_client, payment_type, assign=False):
     """
     Returnează serial și număr doar pentru plăți cash.
-    Dacă assign=True, incrementează serialul în baza de date.
+    Dacă assign=True, rezervă numărul (în interiorul unei tranzacții, vezi services.functions.next_number).
     """
     if is_client and payment_type == "cash":
-        serial = serials.receipt_serial
-        number = serials.receipt_number
-        if assign:
-            serials.receipt_number += 1
-            serials.save()
-        return serial, number
-    return "", ""
\ No newline at end of file
+        return next_number("receipt") if assign else peek_number("receipt")
+    return "", ""
+
+def receipt_print(payment, cancellation=False):
+    """Returns the template, context and file name for printing a (cancellation) receipt."""
+    payment_elements = PaymentElement.objects.filter(payment=payment).order_by("id")
+    leading_number = payment.number.rjust(4,'0')
+
+    context = {
+        "payment": payment,
+        "leading_number": leading_number,
+        "payment_elements": payment_elements,
+        "value_in_words": num2words(payment.value, lang='de').capitalize()
+    }
+    if cancellation:
+        return {
+            "template": "payments/print_cancellation_receipt.html",
+            "context": context,
+            "filename": f"Stornobeleg-{payment.serial}-{payment.number}.pdf",
+        }
+    return {
+        "template": "payments/print_receipt.html",
+        "context": context,
+        "filename": f"Beleg-{payment.serial}-{payment.number}.pdf",
+    }
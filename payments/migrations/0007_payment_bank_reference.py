@@ -0,0 +1,26 @@
+# Generated by Django 4.2.11 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0006_payment_vat_rate_payment_vat_value"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="bank_reference",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("bank_reference", ""), _negated=True),
+                fields=["bank_reference"],
+                name="payment_bank_reference_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.11 on 2026-10-18 22:15
+
+from django.db import migrations, models
+
+# Lines booked twice before the constraint keep their payments for the review,
+# only the first of them keeps the reference
+CLEAR_DUPLICATES = """
+    UPDATE payments_payment SET bank_reference = ''
+    WHERE bank_reference <> '' AND id NOT IN (
+        SELECT min(id) FROM payments_payment WHERE bank_reference <> '' GROUP BY bank_reference
+    );
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0008_payment_date_idx"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CLEAR_DUPLICATES, migrations.RunSQL.noop),
+        migrations.RemoveIndex(
+            model_name="payment",
+            name="payment_bank_reference_idx",
+        ),
+        migrations.AddConstraint(
+            model_name="payment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("bank_reference", ""), _negated=True),
+                fields=("bank_reference",),
+                name="payment_bank_reference_key",
+            ),
+        ),
+    ]
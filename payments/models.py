@@ -19,6 +19,20 @@ class Payment(DocumentBase):
     cancelled_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, default=None, related_name="cancelled_from_%(class)s")
     payment_date = models.DateField(default=timezone.now)
     is_recurrent = models.BooleanField(default=False)
+    # Identifies the bank statement line a payment was imported from, so a statement is imported once
+    bank_reference = models.CharField(max_length=64, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # The date range of the payments list
+            models.Index(fields=["payment_date"], name="payment_date_idx"),
+        ]
+        constraints = [
+            # two imports of the same statement at once cannot both book a line
+            models.UniqueConstraint(
+                fields=["bank_reference"], condition=~models.Q(bank_reference=""), name="payment_bank_reference_key"
+            ),
+        ]
 
     def __str__(self):
         formatted_created_at = self.created_at.strftime("%d.%m.%Y %H:%M")
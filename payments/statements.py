@@ -0,0 +1,366 @@
+import csv
+import hashlib
+import io
+import re
+from collections import Counter, namedtuple
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from xml.etree.ElementTree import ParseError, iterparse
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from invoices.functions import open_items
+from invoices.models import Invoice
+from persons.functions import normalize_iban
+from persons.models import Person
+from services.models import Currency
+from common.rollups import apply_payment_element_changes
+from common.fragments import FRAGMENT_SOURCES, invalidate
+from reports.rollups import apply_changes as apply_revenue_changes
+from .models import Payment, PaymentElement
+from .functions import distribute
+
+# Bank statement import: the CSV and CAMT.053 files are read line by line,
+# the lines are matched to open invoices and booked as bank payments in batches.
+
+StatementLine = namedtuple("StatementLine", "date amount currency iban name text reference")
+
+BATCH_SIZE = 500
+
+# Column names of the CSV exports of the usual banks, compared in lower case
+CSV_COLUMNS = {
+    "date": ("date", "buchungstag", "buchungsdatum", "valutadatum", "valuta", "datum"),
+    "amount": ("amount", "betrag", "betrag (eur)", "umsatz", "betrag in eur"),
+    "currency": ("currency", "währung", "waehrung"),
+    "iban": ("iban", "kontonummer/iban", "iban zahlungsbeteiligter", "iban auftraggeber", "gegenkonto"),
+    "name": ("name", "beguenstigter/zahlungspflichtiger", "name zahlungsbeteiligter", "auftraggeber", "empfänger"),
+    "text": ("text", "verwendungszweck", "purpose", "buchungstext"),
+    "reference": ("reference", "referenz", "bankreferenz", "kundenreferenz"),
+}
+DATE_FORMATS = ("%d.%m.%Y", "%Y-%m-%d", "%d.%m.%y", "%d/%m/%Y")
+
+# Invoice numbers quoted in the remittance text, e.g. "RE 0042", "SE-123"
+INVOICE_REFERENCE = re.compile(r"\b([A-Za-z]{1,10})[\s\-/#]?0*(\d{1,20})\b")
+# Amounts with thousands separators only, e.g. "1.234", "-1,234,567"
+THOUSANDS = re.compile(r"^[+-]?[1-9]\d{0,2}(?:([.,])\d{3})(?:\1\d{3})*$")
+
+# parsing
+
+def parse_amount(value):
+    value = (value or "").replace("€", "").replace(" ", "").strip()
+    if "," in value and "." in value:
+        # the last separator is the decimal one: 1.234,56 or 1,234.56
+        value = value.replace(".", "").replace(",", ".") if value.rfind(",") > value.rfind(".") else value.replace(",", "")
+    elif THOUSANDS.match(value):
+        # a separator repeated or followed by three digits groups thousands: 1.234, 1.234.567
+        value = value.replace(".", "").replace(",", "")
+    else:
+        value = value.replace(",", ".")
+    return parse_decimal(value)
+
+def parse_decimal(value):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        return None
+
+def parse_day(value):
+    value = (value or "").strip()[:10]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+def read_csv(file):
+    """Yields the lines of a CSV statement, the delimiter and the encoding are detected from its start."""
+    head = file.read(8192)
+    file.seek(0)
+    try:
+        head.decode("utf-8-sig")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError as error:
+        # a character cut at the end of the sample is still UTF-8, anything else is the German banks' default
+        encoding = "utf-8-sig" if error.start >= len(head) - 3 else "cp1252"
+    text = io.TextIOWrapper(getattr(file, "file", file), encoding=encoding, errors="replace", newline="")
+    try:
+        dialect = csv.Sniffer().sniff(head.decode(encoding, errors="replace"), delimiters=";,\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+    header = [column.strip().lower() for column in next(reader, [])]
+    columns = {
+        field: next((header.index(name) for name in names if name in header), None)
+        for field, names in CSV_COLUMNS.items()
+    }
+    if columns["date"] is None or columns["amount"] is None:
+        raise ValueError("The statement has no date or amount column.")
+
+    def cell(row, field):
+        index = columns[field]
+        return row[index].strip() if index is not None and index < len(row) else ""
+
+    for row in reader:
+        day, amount = parse_day(cell(row, "date")), parse_amount(cell(row, "amount"))
+        if day is None or not amount:
+            continue
+        yield StatementLine(
+            day, amount, cell(row, "currency") or "EUR", normalize_iban(cell(row, "iban")),
+            cell(row, "name"), cell(row, "text"), cell(row, "reference"),
+        )
+
+def local_name(element):
+    return element.tag.rsplit("}", 1)[-1]
+
+def child(element, *path):
+    """The descendant at the path of local tag names (CAMT files come with varying namespaces)."""
+    for name in path:
+        if element is None:
+            return None
+        element = next((c for c in element if local_name(c) == name), None)
+    return element
+
+def children(element, name):
+    return [c for c in element if local_name(c) == name] if element is not None else []
+
+def child_text(element, *path):
+    found = child(element, *path)
+    return (found.text or "").strip() if found is not None else ""
+
+def read_camt053(file):
+    """Yields the lines of a CAMT.053 statement, one per transaction, releasing every entry once it is read."""
+    for event, element in iterparse(file, events=("end",)):
+        if local_name(element) != "Ntry":
+            continue
+        credit = child_text(element, "CdtDbtInd") == "CRDT"
+        day = parse_day(child_text(element, "BookgDt", "Dt") or child_text(element, "BookgDt", "DtTm"))
+        entry_reference = child_text(element, "AcctSvcrRef") or child_text(element, "NtryRef")
+        details = children(child(element, "NtryDtls"), "TxDtls") or [None]
+        for transaction_details in details:
+            # a batch booking carries the amount of every transaction in its details
+            amount = child(transaction_details, "AmtDtls", "TxAmt", "Amt") if len(details) > 1 else None
+            if amount is None:
+                amount = child(element, "Amt")
+            # CAMT amounts always have a decimal point: 1234.500 is not grouped
+            value = parse_decimal((amount.text or "").strip() if amount is not None else "")
+            if day is None or not value:
+                continue
+            party = "Dbtr" if credit else "Cdtr"
+            text = " ".join(
+                (c.text or "").strip() for c in children(child(transaction_details, "RmtInf"), "Ustrd")
+            ) or child_text(transaction_details, "RmtInf", "Strd", "CdtrRefInf", "Ref")
+            yield StatementLine(
+                day,
+                value if credit else -value,
+                amount.get("Ccy", "EUR"),
+                normalize_iban(child_text(transaction_details, "RltdPties", f"{party}Acct", "Id", "IBAN")),
+                child_text(transaction_details, "RltdPties", party, "Nm")
+                or child_text(transaction_details, "RltdPties", party, "Pty", "Nm"),
+                text or child_text(element, "AddtlNtryInf"),
+                child_text(transaction_details, "Refs", "AcctSvcrRef")
+                or child_text(transaction_details, "Refs", "EndToEndId")
+                or entry_reference,
+            )
+        element.clear()
+
+def read_statement(file):
+    """Yields the lines of an uploaded statement, CAMT.053 for XML files and CSV otherwise."""
+    start = file.read(512).lstrip()
+    file.seek(0)
+    if start.startswith(b"<") or file.name.lower().endswith(".xml"):
+        return read_camt053(file)
+    return read_csv(file)
+
+def line_key(line, occurrence=0):
+    """
+    The bank reference a payment keeps of its statement line, the same for every import of the line.
+    Identical lines of one file (two equal transfers on a day) are told apart by their occurrence,
+    the first one keeps the plain key.
+    """
+    parts = (line.date, line.amount, line.iban, line.text, line.reference) + ((occurrence,) if occurrence else ())
+    return hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+
+# matching
+
+# The ISO codes of the statement lines with the symbols and names the currencies are entered with, in lower case
+CURRENCY_ALIASES = {
+    "EUR": {"eur", "€", "euro"},
+    "USD": {"usd", "$", "dollar", "us-dollar"},
+    "GBP": {"gbp", "£", "pound", "pfund"},
+    "CHF": {"chf", "franken", "franc"},
+    "RON": {"ron", "lei", "leu"},
+}
+
+def currency_codes():
+    """{currency_id: ISO code} of the currencies recognized by their symbol or name."""
+    codes = {}
+    for pk, symbol, name in Currency.objects.values_list("id", "symbol", "name"):
+        for code, aliases in CURRENCY_ALIASES.items():
+            if {(symbol or "").strip().lower(), (name or "").strip().lower()} & aliases:
+                codes[pk] = code
+    return codes
+
+def quoted_invoices(text):
+    """The (serial, number) pairs quoted in a remittance text."""
+    return {(serial.upper(), number) for serial, number in INVOICE_REFERENCE.findall(text)}
+
+def match_batch(lines):
+    """
+    Matches a batch of lines with a fixed number of indexed queries: [(line, person_id, [(invoice_id, balance)])].
+    The invoices quoted in the text come first, then the open invoices of the person with the payer's IBAN
+    (the one with the exact amount, else all of them oldest first), then the only open invoice with the amount.
+    Only invoices in the currency of the line are paid by it.
+    """
+    ibans = {line.iban for line in lines if line.iban}
+    persons = dict(
+        Person.objects.filter(company_iban__in=ibans).order_by("id").values_list("company_iban", "id")
+    ) if ibans else {}
+    quoted = set().union(*(quoted_invoices(line.text) for line in lines))
+    amounts = {abs(line.amount) for line in lines}
+
+    fields = ("id", "person_id", "is_client", "currency_id", "serial", "number", "balance")
+    invoices = open_items().annotate(balance=F("value") - F("payed")).order_by("created_at", "id")
+    candidates = {}
+    if quoted:
+        for row in invoices.filter(
+            serial__in={serial for serial, number in quoted},
+            number__in={number for serial, number in quoted},
+        ).values(*fields):
+            candidates[row["id"]] = row
+    if persons:
+        for row in invoices.filter(person_id__in=set(persons.values())).values(*fields):
+            candidates[row["id"]] = row
+    for row in invoices.filter(balance__in=amounts).values(*fields):
+        candidates[row["id"]] = row
+    balances = {pk: row["balance"] for pk, row in candidates.items()}
+    ordered = list(candidates.values())
+    by_number = {(row["serial"].upper(), row["number"].lstrip("0")): row for row in ordered}
+    codes = currency_codes()
+
+    matches = []
+    for line in lines:
+        is_client, value = line.amount > 0, abs(line.amount)
+        person_id = persons.get(line.iban)
+        currency = line.currency.upper()
+
+        def payable(row):
+            return (
+                row["is_client"] == is_client and balances[row["id"]] > 0
+                and codes.get(row["currency_id"]) == currency
+            )
+
+        open_rows = [row for row in ordered if payable(row)]
+        chosen = [by_number[key] for key in quoted_invoices(line.text) if key in by_number and payable(by_number[key])]
+        if chosen:
+            person_id = person_id if any(row["person_id"] == person_id for row in chosen) else chosen[0]["person_id"]
+            chosen = [row for row in chosen if row["person_id"] == person_id]
+        elif person_id:
+            own = [row for row in open_rows if row["person_id"] == person_id]
+            chosen = [row for row in own if balances[row["id"]] == value][:1] or own
+        else:
+            same_amount = [row for row in open_rows if balances[row["id"]] == value]
+            if len(same_amount) == 1:
+                chosen = same_amount
+                person_id = chosen[0]["person_id"]
+
+        allocation = [(row["id"], balances[row["id"]]) for row in chosen]
+        # the next lines of the batch see what this one pays
+        for pk, share in distribute(allocation, value).items():
+            balances[pk] -= share
+        matches.append((line, person_id, allocation))
+    return matches
+
+# booking
+
+def import_batch(keyed_lines, user):
+    """Books the matched (key, line) pairs of a batch as bank payments, returns (booked, unmatched, skipped)."""
+    keys = dict(keyed_lines)
+    imported = set(Payment.objects.filter(bank_reference__in=keys).values_list("bank_reference", flat=True))
+    keyed_lines = [(key, line) for key, line in keys.items() if key not in imported]
+    skipped = len(keys) - len(keyed_lines)
+
+    booked, unmatched = [], []
+    with transaction.atomic():
+        matches = match_batch([line for key, line in keyed_lines])
+        currencies = dict(
+            Invoice.objects.filter(
+                id__in={pk for line, person_id, allocation in matches for pk, balance in allocation}
+            ).values_list("id", "currency_id")
+        )
+        payments, allocations = [], []
+        for (key, line), (line, person_id, allocation) in zip(keyed_lines, matches):
+            values = {pk: share for pk, share in distribute(allocation, abs(line.amount)).items() if share}
+            if not values:
+                unmatched.append({"line": line, "person_id": person_id, "remaining": abs(line.amount)})
+                continue
+            payments.append(Payment(
+                type="bank",
+                person_id=person_id,
+                is_client=line.amount > 0,
+                payment_date=line.date,
+                currency_id=currencies[next(iter(values))],
+                value=sum(values.values()),
+                description=line.text[:255],
+                bank_reference=key,
+                modified_by=user,
+                created_by=user,
+            ))
+            allocations.append(values)
+            remaining = abs(line.amount) - payments[-1].value
+            if remaining:
+                # more than the open invoices ask for, the rest is left for the review
+                unmatched.append({"line": line, "person_id": person_id, "remaining": remaining})
+
+        Payment.objects.bulk_create(payments)
+        elements = [
+            PaymentElement(payment=payment, invoice_id=pk, value=share)
+            for payment, values in zip(payments, allocations)
+            for pk, share in values.items()
+        ]
+        PaymentElement.objects.bulk_create(elements)
+        # bulk writes send no signals, the rollups are followed here
+        apply_payment_element_changes(elements)
+        apply_revenue_changes(payments)
+        if payments:
+            invalidate(FRAGMENT_SOURCES[PaymentElement])
+        booked.extend(payments)
+    return booked, unmatched, skipped
+
+def import_statement(lines, user, batch_size=BATCH_SIZE):
+    """
+    Imports the lines of a statement batch by batch, each batch in its own transaction.
+    A file that cannot be read past some line keeps what was booked before it:
+    the result lists those payments with the error, so they can still be reviewed.
+    """
+    result = {"booked": [], "unmatched": [], "skipped": 0, "read": 0, "error": ""}
+    occurrences = Counter()
+
+    def book(batch):
+        try:
+            booked, unmatched, skipped = import_batch(batch, user)
+        except IntegrityError:
+            # an import of the same statement running at the same time booked some of the lines first
+            # (payment_bank_reference_key), the batch was rolled back and is matched again without them
+            booked, unmatched, skipped = import_batch(batch, user)
+        result["booked"] += booked
+        result["unmatched"] += unmatched
+        result["skipped"] += skipped
+
+    def read():
+        try:
+            yield from lines
+        except (ValueError, ParseError) as error:
+            result["error"] = str(error)
+
+    batch = []
+    for line in read():
+        key = line_key(line)
+        batch.append((line_key(line, occurrences[key]), line))
+        occurrences[key] += 1
+        result["read"] += 1
+        if len(batch) == batch_size:
+            book(batch)
+            batch = []
+    if batch:
+        book(batch)
+    return result
@@ -1,3 +1,160 @@
-from django.test import TestCase
+import io
+from datetime import date
+from decimal import Decimal
+from django.test import SimpleTestCase, TestCase
+from persons.models import Person
+from services.models import Currency
+from users.models import CustomUser
+from invoices.models import Invoice
+from .models import Payment
+from .statements import (
+    StatementLine, parse_amount, read_csv, read_camt053, quoted_invoices, match_batch, import_statement
+)
 
-# Create your tests here.
+IBAN = "DE89370400440532013000"
+
+CSV_STATEMENT = (
+    "Buchungstag;Betrag;Währung;IBAN Auftraggeber;Auftraggeber;Verwendungszweck\r\n"
+    "01.10.2026;1.234,56;EUR;DE89 3704 0044 0532 0130 00;Anna Schmidt;Rechnung RE 0042\r\n"
+    "02.10.2026;-50,00;EUR;;Druckerei;Papier\r\n"
+    "Summe;;;;;\r\n"
+)
+
+CAMT_STATEMENT = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+  <BkToCstmrStmt><Stmt>
+    <Ntry>
+      <Amt Ccy="EUR">100.00</Amt>
+      <CdtDbtInd>CRDT</CdtDbtInd>
+      <BookgDt><Dt>2026-10-01</Dt></BookgDt>
+      <AcctSvcrRef>REF-1</AcctSvcrRef>
+      <NtryDtls><TxDtls>
+        <RltdPties>
+          <Dbtr><Nm>Anna Schmidt</Nm></Dbtr>
+          <DbtrAcct><Id><IBAN>{IBAN}</IBAN></Id></DbtrAcct>
+        </RltdPties>
+        <RmtInf><Ustrd>RE 0042</Ustrd></RmtInf>
+      </TxDtls></NtryDtls>
+    </Ntry>
+    <Ntry>
+      <Amt Ccy="USD">1234.500</Amt>
+      <CdtDbtInd>DBIT</CdtDbtInd>
+      <BookgDt><Dt>2026-10-02</Dt></BookgDt>
+      <AcctSvcrRef>REF-2</AcctSvcrRef>
+    </Ntry>
+  </Stmt></BkToCstmrStmt>
+</Document>
+"""
+
+
+class ParseTests(SimpleTestCase):
+
+    def test_amounts(self):
+        self.assertEqual(parse_amount("1.234,56"), Decimal("1234.56"))
+        self.assertEqual(parse_amount("1,234.56"), Decimal("1234.56"))
+        self.assertEqual(parse_amount("-12,50 €"), Decimal("-12.50"))
+        self.assertEqual(parse_amount("1234.50"), Decimal("1234.50"))
+        self.assertEqual(parse_amount("0,500"), Decimal("0.5"))
+        self.assertIsNone(parse_amount(""))
+        self.assertIsNone(parse_amount("Summe"))
+
+    def test_thousands_without_decimals(self):
+        # the German exports leave out ",00": "1.234" is one thousand two hundred thirty-four euros
+        self.assertEqual(parse_amount("1.234"), Decimal("1234"))
+        self.assertEqual(parse_amount("1,234"), Decimal("1234"))
+        self.assertEqual(parse_amount("-1.234.567"), Decimal("-1234567"))
+
+    def test_read_csv(self):
+        lines = list(read_csv(io.BytesIO(CSV_STATEMENT.encode("cp1252"))))
+        self.assertEqual(lines, [
+            StatementLine(date(2026, 10, 1), Decimal("1234.56"), "EUR", IBAN, "Anna Schmidt", "Rechnung RE 0042", ""),
+            StatementLine(date(2026, 10, 2), Decimal("-50.00"), "EUR", "", "Druckerei", "Papier", ""),
+        ])
+
+    def test_read_csv_needs_date_and_amount(self):
+        with self.assertRaises(ValueError):
+            list(read_csv(io.BytesIO(b"Name;Verwendungszweck\r\nAnna;RE 1\r\n")))
+
+    def test_read_camt053(self):
+        lines = list(read_camt053(io.BytesIO(CAMT_STATEMENT.encode())))
+        self.assertEqual(lines, [
+            StatementLine(date(2026, 10, 1), Decimal("100.00"), "EUR", IBAN, "Anna Schmidt", "RE 0042", "REF-1"),
+            StatementLine(date(2026, 10, 2), Decimal("-1234.500"), "USD", "", "", "", "REF-2"),
+        ])
+
+    def test_quoted_invoices(self):
+        self.assertEqual(quoted_invoices("Rechnung RE 0042 und re-43, SE/7"), {("RE", "42"), ("RE", "43"), ("SE", "7")})
+        self.assertEqual(quoted_invoices("Danke"), set())
+
+
+class StatementTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("anna", password="secret")
+        cls.euro = Currency.objects.create(symbol="€", name="Euro")
+        cls.dollar = Currency.objects.create(symbol="$", name="Dollar")
+        cls.anna = Person.objects.create(firstname="Anna", lastname="Schmidt", company_iban=IBAN)
+        cls.jonas = Person.objects.create(firstname="Jonas", lastname="Weber")
+
+    def invoice(self, person, number, value, currency=None):
+        return Invoice.objects.create(
+            person=person, serial="RE", number=number, value=Decimal(value), currency=currency or self.euro
+        )
+
+    def line(self, amount, text="", iban="", currency="EUR"):
+        return StatementLine(date(2026, 10, 1), Decimal(amount), currency, iban, "", text, "")
+
+    def matched(self, line):
+        [(line, person_id, allocation)] = match_batch([line])
+        return person_id, [pk for pk, balance in allocation]
+
+    def test_the_quoted_number_comes_first(self):
+        self.invoice(self.anna, "41", "100.00")
+        quoted = self.invoice(self.jonas, "42", "100.00")
+        # paid from Anna's account for Jonas' invoice
+        self.assertEqual(self.matched(self.line("100.00", "RE 0042", IBAN)), (self.jonas.id, [quoted.id]))
+
+    def test_then_the_invoices_of_the_iban(self):
+        self.invoice(self.anna, "41", "80.00")
+        exact = self.invoice(self.anna, "42", "100.00")
+        self.invoice(self.jonas, "43", "100.00")
+        self.assertEqual(self.matched(self.line("100.00", "Danke", IBAN)), (self.anna.id, [exact.id]))
+
+    def test_then_the_only_invoice_with_the_amount(self):
+        only = self.invoice(self.jonas, "42", "100.00")
+        self.invoice(self.anna, "43", "70.00")
+        self.assertEqual(self.matched(self.line("100.00")), (self.jonas.id, [only.id]))
+
+        # two invoices with the amount are left for the review
+        self.invoice(self.anna, "44", "100.00")
+        self.assertEqual(self.matched(self.line("100.00")), (None, []))
+
+    def test_other_currencies_are_not_paid(self):
+        self.invoice(self.jonas, "42", "100.00", self.dollar)
+        self.assertEqual(self.matched(self.line("100.00", "RE 0042")), (None, []))
+        self.assertEqual(self.matched(self.line("100.00", "RE 0042", currency="USD"))[0], self.jonas.id)
+
+    def test_a_statement_is_imported_once(self):
+        invoice = self.invoice(self.anna, "42", "100.00")
+        lines = [self.line("60.00", "RE 0042", IBAN), self.line("30.00", "Danke", IBAN)]
+
+        result = import_statement(lines, self.user)
+        self.assertEqual((len(result["booked"]), result["skipped"]), (2, 0))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.payed, Decimal("90.00"))
+
+        result = import_statement(lines, self.user)
+        self.assertEqual((len(result["booked"]), result["skipped"]), (0, 2))
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_identical_lines_are_booked_apart(self):
+        invoice = self.invoice(self.anna, "42", "100.00")
+        # two equal transfers on a day, in separate batches
+        lines = [self.line("50.00", "RE 0042", IBAN), self.line("50.00", "RE 0042", IBAN)]
+
+        result = import_statement(lines, self.user, batch_size=1)
+        self.assertEqual(len(result["booked"]), 2)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.payed, Decimal("100.00"))
+        self.assertEqual(import_statement(lines, self.user)["skipped"], 2)
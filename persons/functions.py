@@ -0,0 +1,68 @@
+import time
+from functools import lru_cache
+from django.db.models import Q, Case, When, Value, IntegerField, FloatField
+from django.db.models.functions import Lower, Greatest
+from django.contrib.postgres.search import TrigramSimilarity
+from common.helpers import Unaccent
+from .models import Person
+
+# helping functions
+
+AUTOCOMPLETE_LIMIT = 10
+# Suggestions of a term are kept per worker for this many seconds, so new persons show up quickly
+AUTOCOMPLETE_TTL = 30
+SEARCH_FIELDS = ("firstname", "lastname", "company_name")
+
+def normalize_iban(iban):
+    """IBANs are stored and compared without spaces and in upper case."""
+    return "".join((iban or "").split()).upper()
+
+def search_persons(term, role=""):
+    """
+    Persons matching the term in the name or company, the prefix matches first and then by similarity.
+    Filters on Unaccent(Lower(field)) use the trigram indexes of persons (migration 0004).
+    """
+    term = term.strip().lower()
+    persons = Person.objects.annotate(**{
+        f"{field}_unaccent": Unaccent(Lower(field)) for field in SEARCH_FIELDS
+    }).filter(
+        Q(firstname_unaccent__contains=term)
+        | Q(lastname_unaccent__contains=term)
+        | Q(company_name_unaccent__contains=term)
+    )
+    if role == "provider":
+        # Providers are the persons offering services, as in p_providers
+        persons = persons.exclude(services="")
+    return persons.annotate(
+        prefix=Case(
+            When(
+                Q(firstname_unaccent__startswith=term)
+                | Q(lastname_unaccent__startswith=term)
+                | Q(company_name_unaccent__startswith=term),
+                then=Value(1),
+            ),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        similarity=Greatest(
+            *[TrigramSimilarity(f"{field}_unaccent", term) for field in SEARCH_FIELDS],
+            output_field=FloatField(),
+        ),
+    ).order_by("-prefix", "-similarity", "lastname", "id")
+
+@lru_cache(maxsize=512)
+def cached_suggestions(term, role, limit, period):
+    # period changes every AUTOCOMPLETE_TTL seconds and retires the older entries
+    return tuple(
+        {
+            "id": p.id,
+            "firstname": p.firstname,
+            "lastname": p.lastname,
+            "company_name": p.company_name,
+        }
+        for p in search_persons(term, role).only("id", "firstname", "lastname", "company_name")[:limit]
+    )
+
+def person_suggestions(term, role="", limit=AUTOCOMPLETE_LIMIT):
+    """The top suggestions for a term, from the LRU of this worker when the term was asked lately."""
+    return list(cached_suggestions(term.strip().lower(), role, limit, int(time.monotonic() // AUTOCOMPLETE_TTL)))
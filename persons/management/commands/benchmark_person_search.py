@@ -0,0 +1,63 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from common.helpers import Unaccent
+from persons.models import Person
+
+FIRSTNAMES = ["Jürgen", "Zoë", "Ana", "Mihai", "Renée", "Sören", "Ioana", "François", "Łukasz", "Agnès"]
+LASTNAMES = ["Müller", "Schäfer", "Popescu", "Dvořák", "Öztürk", "Brâncuși", "Ibáñez", "Nørgaard", "Weiß", "Kovács"]
+SERVICES = ["Übersetzung", "Dolmetschen", "Lektorat", "Beglaubigung", "Untertitel"]
+CITIES = ["München", "Köln", "Düsseldorf", "Brașov", "Zürich", "Malmö", "Göteborg", "Kraków"]
+
+
+class Command(BaseCommand):
+    help = 'Shows the plans and timings of the person searches on generated persons (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--persons", type=int, default=200000, help="Number of generated persons (default 200000).")
+        parser.add_argument("--search", default="mull", help="Search text (default 'mull').")
+
+    def handle(self, *args, **options):
+        search = options["search"].lower()
+        random.seed(1)
+        with transaction.atomic():
+            started = time.perf_counter()
+            Person.objects.bulk_create(
+                (
+                    Person(
+                        firstname=f"{random.choice(FIRSTNAMES)}{i}",
+                        lastname=random.choice(LASTNAMES),
+                        company_name=f"{random.choice(LASTNAMES)} GmbH {i}" if i % 3 == 0 else "",
+                        services=random.choice(SERVICES),
+                        address=f"Hauptstraße {i % 200}, {random.choice(CITIES)}",
+                    )
+                    for i in range(options["persons"])
+                ),
+                batch_size=5000,
+            )
+            with transaction.get_connection().cursor() as cursor:
+                cursor.execute(f"ANALYZE {Person._meta.db_table}")
+            self.stdout.write(f"{options['persons']} persons generated in {time.perf_counter() - started:.1f}s")
+
+            # The search of persons.views.c_clients
+            persons = Person.objects.annotate(
+                firstname_unaccent=Unaccent(Lower("firstname")),
+                lastname_unaccent=Unaccent(Lower("lastname")),
+                company_unaccent=Unaccent(Lower("company_name")),
+            ).filter(
+                Q(firstname_unaccent__contains=search)
+                | Q(lastname_unaccent__contains=search)
+                | Q(company_unaccent__contains=search)
+            ).order_by("firstname")[:30]
+            self.stdout.write(persons.explain(analyze=True))
+
+            started = time.perf_counter()
+            found = len(persons)
+            self.stdout.write(self.style.SUCCESS(
+                f"'{search}': {found} persons in {(time.perf_counter() - started) * 1000:.1f} ms"
+            ))
+            # Nothing generated stays in the database
+            transaction.set_rollback(True)
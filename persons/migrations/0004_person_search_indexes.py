@@ -0,0 +1,35 @@
+# Generated by Django 4.2.11 on 2026-10-18 14:40
+
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations
+
+# unaccent() is only STABLE (it depends on the search_path), an index needs an IMMUTABLE function.
+# The wrapper names the dictionary with its schema, so it always gives the same result.
+UNACCENT_FUNCTION = """
+    CREATE OR REPLACE FUNCTION se_unaccent(text) RETURNS text AS
+    $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+"""
+
+# Trigram indexes on se_unaccent(lower(field)), the SQL of common.helpers.Unaccent(Lower(field))
+SEARCH_FIELDS = ["firstname", "lastname", "company_name", "services", "address"]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("persons", "0003_alter_person_token"),
+    ]
+
+    operations = [
+        UnaccentExtension(),
+        TrigramExtension(),
+        migrations.RunSQL(UNACCENT_FUNCTION, "DROP FUNCTION IF EXISTS se_unaccent(text);"),
+    ] + [
+        migrations.RunSQL(
+            f"CREATE INDEX IF NOT EXISTS person_{field}_trgm_idx ON persons_person "
+            f"USING gin (se_unaccent(lower({field})) gin_trgm_ops);",
+            f"DROP INDEX IF EXISTS person_{field}_trgm_idx;",
+        )
+        for field in SEARCH_FIELDS
+    ]
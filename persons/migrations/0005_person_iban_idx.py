@@ -0,0 +1,28 @@
+# Generated by Django 4.2.11 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+# IBANs are compared without spaces and in upper case (persons.functions.normalize_iban)
+NORMALIZE_IBANS = """
+    UPDATE persons_person SET company_iban = upper(replace(company_iban, ' ', ''))
+    WHERE company_iban <> '';
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("persons", "0004_person_search_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(NORMALIZE_IBANS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name="person",
+            index=models.Index(
+                condition=models.Q(("company_iban", ""), _negated=True),
+                fields=["company_iban"],
+                name="person_iban_idx",
+            ),
+        ),
+    ]
@@ -52,6 +52,12 @@ class Person(models.Model):
     services = models.CharField(max_length=255, blank=True)
     token = models.CharField(max_length=20, blank=True)
 
+    class Meta:
+        # Bank statement lines are matched to their payer by IBAN (payments.statements)
+        indexes = [
+            models.Index(fields=["company_iban"], condition=~models.Q(company_iban=""), name="person_iban_idx"),
+        ]
+
     def __str__(self):
         if self.company_name == "":
             company = ""
@@ -5,4 +5,5 @@ urlpatterns = [
     path("clients/clients/", views.c_clients, name="c_clients"),
     path("providers/providers/", views.p_providers, name="p_providers"),
     path("persons/<int:person_id>/", views.person_detail, name="person_detail"),
+    path("persons/autocomplete/", views.autocomplete, name="person_autocomplete"),
 ]
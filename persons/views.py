@@ -1,16 +1,18 @@
 from django.shortcuts import render, get_object_or_404
+from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q, Func
+from django.db.models import Count, Q, OuterRef
 from .models import Person
-from orders.models import Order
-from appointments.models import Appointment
 from django.core.paginator import Paginator
 from django.utils import timezone
 import random
 import string
 import phonenumbers
 from django.db.models.functions import Lower
-from common.helpers import Unaccent
+from common.helpers import Unaccent, SubqueryCount
+from orders.models import Order
+from appointments.models import Appointment
+from .functions import person_suggestions, normalize_iban, AUTOCOMPLETE_LIMIT
 
 
 def format_phone_number(raw_number, default_region='DE'):
@@ -33,7 +35,7 @@ def format_phone_number(raw_number, default_region='DE'):
 @login_required(login_url="/login/")
 def c_clients(request):
     # default filter
-    filtered_persons = Person.objects.order_by("-created_at")[:30]
+    filtered_persons = Person.objects.order_by("-created_at", "-id")
     # finding search elements
     search = request.POST.get("search","")
     if search == "":
@@ -46,18 +48,17 @@ def c_clients(request):
             lastname_unaccent=Unaccent(Lower('lastname')),
             company_unaccent=Unaccent(Lower('company_name'))
         ).filter(
-            Q(firstname_unaccent__icontains=search)
-            | Q(lastname_unaccent__icontains=search)
-            | Q(company_unaccent__icontains=search)
-        ).order_by("firstname")[:30]
+            Q(firstname_unaccent__contains=search)
+            | Q(lastname_unaccent__contains=search)
+            | Q(company_unaccent__contains=search)
+        ).order_by("firstname", "id")
     else:
         search = ""
 
-    selected_clients = []
-    for person in filtered_persons:
-        person_total_orders = Order.objects.filter(person=person, is_client=True).count()
-        client = {"client": person, "total_orders": person_total_orders}
-        selected_clients.append(client)
+    # the orders are counted in the query of the page, the paginator adds only the count of persons
+    selected_clients = filtered_persons.select_related("modified_by").annotate(
+        total_orders=Count("order", filter=Q(order__is_client=True))
+    )
     page = request.GET.get("page")
     paginator = Paginator(selected_clients, 10)
     clients_on_page = paginator.get_page(page)
@@ -71,7 +72,7 @@ def c_clients(request):
 @login_required(login_url="/login/")
 def p_providers(request):
     # default filter
-    filtered_persons = Person.objects.exclude(services='').order_by("-created_at")[:30]
+    filtered_persons = Person.objects.exclude(services='').order_by("-created_at", "-id")
     # Function to simplify getting parameters from POST or GET
     def get_parameter(request, param_name):
         if request.method == 'POST':
@@ -97,24 +98,23 @@ def p_providers(request):
                 address_unaccent=Unaccent(Lower('address'))
             )
             .filter(
-                Q(firstname_unaccent__icontains=search_name)
-                | Q(lastname_unaccent__icontains=search_name)
-                | Q(company_unaccent__icontains=search_name)
+                Q(firstname_unaccent__contains=search_name)
+                | Q(lastname_unaccent__contains=search_name)
+                | Q(company_unaccent__contains=search_name)
             )
-            .filter(services_unaccent__icontains=search_service)
-            .filter(address_unaccent__icontains=search_place)
+            .filter(services_unaccent__contains=search_service)
+            .filter(address_unaccent__contains=search_place)
             .exclude(services='')
-            .order_by("firstname")[:30]
+            .order_by("firstname", "id")
         )
     else:
         search_name = search_service = search_place = ""
     
-    selected_providers = []
-    for person in filtered_persons:
-        person_total_orders = Order.objects.filter(person=person, is_client=False).count()
-        person_total_appointments = Appointment.objects.filter(with_person=person).count()
-        provider = {"provider": person, "total_orders": person_total_orders, "total_appointments": person_total_appointments}
-        selected_providers.append(provider)
+    # orders and appointments are counted in a subquery each, joining both would multiply their rows
+    selected_providers = filtered_persons.annotate(
+        total_orders=SubqueryCount(Order.objects.filter(person=OuterRef("pk"), is_client=False).values("id")),
+        total_appointments=SubqueryCount(Appointment.objects.filter(with_person=OuterRef("pk")).values("id")),
+    )
     page = request.GET.get("page")
     paginator = Paginator(selected_providers, 10)
     providers_on_page = paginator.get_page(page)
@@ -144,7 +144,7 @@ def person_detail(request, person_id):
             person.identity_card = request.POST.get("identity_card")
             person.company_name = request.POST.get("company_name").strip()
             person.company_tax_code = request.POST.get("company_tax_code")
-            person.company_iban = request.POST.get("company_iban")
+            person.company_iban = normalize_iban(request.POST.get("company_iban"))
             person.email = request.POST.get("email")
             person.phone = format_phone_number(request.POST.get("phone"))
             person.address = request.POST.get("address").strip()
@@ -182,7 +182,7 @@ def person_detail(request, person_id):
                         gender=request.POST.get("gender"),
                         identity_card=request.POST.get("identity_card"),
                         company_tax_code=request.POST.get("company_tax_code"),
-                        company_iban=request.POST.get("company_iban"),
+                        company_iban=normalize_iban(request.POST.get("company_iban")),
                         phone=format_phone_number(request.POST.get("phone")),
                         address=request.POST.get("address").strip(),
                         email=request.POST.get("email"),
@@ -200,3 +200,18 @@ def person_detail(request, person_id):
             update = ""
             person = ""
     return render(request, "persons/clients/person.html", {"person": person, "update": update})
+
+
+@login_required(login_url="/login/")
+def autocomplete(request):
+    # Suggestions for the person selection of the editors, fetched while typing
+    term = request.GET.get("q", "").strip()
+    role = request.GET.get("role", "")
+    try:
+        limit = min(max(int(request.GET.get("limit", AUTOCOMPLETE_LIMIT)), 1), 50)
+    except ValueError:
+        limit = AUTOCOMPLETE_LIMIT
+    # limit the search string to minimum 3 chars
+    if len(term) < 3:
+        return JsonResponse({"results": []})
+    return JsonResponse({"results": person_suggestions(term, role, limit)})
@@ -0,0 +1,78 @@
+import hashlib
+import time
+from datetime import date
+from django.core.cache import cache
+from django.db import transaction
+
+# Revenue report results are cached under keys that carry the version of every month of their range.
+# reports.rollups bumps the version of a month when a rollup of one of its days changes (an invoice
+# or payment of that day was saved or deleted), so an outdated report is never served again.
+CACHE_TIMEOUT = 60 * 60 * 24
+ALL_MONTHS = "revenue:version"  # bumped by a rebuild of the rollups
+
+# Cache statistics of this worker, recompute times in seconds
+CACHE_STATS = {"hits": 0, "misses": 0, "recompute_total": 0.0, "recompute_last": None}
+
+def month_key(day):
+    return f"revenue:version:{day.year}-{day.month:02d}"
+
+def month_keys(start, end):
+    """The version keys of every month between two days."""
+    keys = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        keys.append(month_key(date(year, month, 1)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+def new_version():
+    # A lost version key must not fall back to a value an outdated report was cached under
+    return time.time_ns()
+
+def report_key(start, end, range_type):
+    """The cache key of a report, changing with the version of any month of its range."""
+    keys = [ALL_MONTHS] + month_keys(start, end)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+    stamp = ",".join(str(versions[key]) for key in keys)
+    return f"revenue:report:{start}:{end}:{range_type}:{hashlib.sha1(stamp.encode()).hexdigest()}"
+
+def cached_report(start, end, range_type, compute):
+    """Returns the cached report of the range, or computes and caches it."""
+    key = report_key(start, end, range_type)
+    report = cache.get(key)
+    if report is not None:
+        CACHE_STATS["hits"] += 1
+        return report
+    started = time.perf_counter()
+    report = compute()
+    duration = time.perf_counter() - started
+    CACHE_STATS["misses"] += 1
+    CACHE_STATS["recompute_total"] += duration
+    CACHE_STATS["recompute_last"] = duration
+    cache.set(key, report, CACHE_TIMEOUT)
+    return report
+
+def bump(keys):
+    """Moves the versions to new values once the current transaction commits."""
+    def bump_versions():
+        cache.set_many({key: new_version() for key in keys}, None)
+    transaction.on_commit(bump_versions)
+
+def invalidate_days(days):
+    bump({month_key(day) for day in days})
+
+def invalidate_all():
+    bump([ALL_MONTHS])
+
+def cache_stats():
+    """Returns the cache statistics of this worker, with the hit ratio and the average recompute time."""
+    requests = CACHE_STATS["hits"] + CACHE_STATS["misses"]
+    return dict(
+        CACHE_STATS,
+        hit_ratio=CACHE_STATS["hits"] / requests if requests else None,
+        recompute_average=CACHE_STATS["recompute_total"] / CACHE_STATS["misses"] if CACHE_STATS["misses"] else None,
+    )
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from reports.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily revenue rollups used by the revenue report'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day to rebuild (YYYY-MM-DD, default: the first document).")
+        parser.add_argument("--end", help="Last day to rebuild (YYYY-MM-DD, default: the last document).")
+
+    def handle(self, *args, **options):
+        start, end = self.parse_day(options["start"]), self.parse_day(options["end"])
+        if start and end and start > end:
+            raise CommandError("Invalid date range.")
+
+        started = time.perf_counter()
+        count = rebuild(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} daily revenue rows rebuilt in {time.perf_counter() - started:.2f}s."
+        ))
+
+    def parse_day(self, value):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date: {value}")
+        return day
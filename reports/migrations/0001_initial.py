@@ -0,0 +1,31 @@
+# Generated by Django 4.2.11 on 2026-10-18 14:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("services", "0003_delete_serialul"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('is_client', models.BooleanField(default=True)),
+                ('kind', models.CharField(choices=[('invoiced', 'Invoiced'), ('payed', 'Payed')], max_length=8)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('currency', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='services.currency')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='revenueday',
+            constraint=models.UniqueConstraint(fields=('day', 'is_client', 'kind', 'currency'), name='revenue_day_key'),
+        ),
+    ]
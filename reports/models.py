@@ -1,3 +1,22 @@
 from django.db import models
+from services.models import Currency
 
 # Create your models here.
+
+
+class RevenueDay(models.Model):
+    """Signed total of the invoices or payments of one day, kept up to date by reports.rollups."""
+    kind_choices = [("invoiced", "Invoiced"), ("payed", "Payed")]
+    day = models.DateField()
+    is_client = models.BooleanField(default=True)
+    kind = models.CharField(max_length=8, choices=kind_choices)
+    currency = models.ForeignKey(Currency, on_delete=models.SET_NULL, null=True, blank=True)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "is_client", "kind", "currency"], name="revenue_day_key"),
+        ]
+
+    def __str__(self):
+        return f"Revenue {self.day} {self.kind} ({'client' if self.is_client else 'provider'}): {self.value}"
@@ -0,0 +1,141 @@
+from datetime import date, datetime
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from invoices.models import Invoice
+from payments.models import Payment
+from .models import RevenueDay
+from .caching import invalidate_days, invalidate_all
+
+# Rollup maintenance for the daily revenue totals (RevenueDay) behind reports.views.revenue.
+# Single row saves and deletes of invoices and payments are followed through signals;
+# bulk writes (bulk_update, queryset.update) must call apply_changes themselves,
+# everything else can be repaired with `manage.py rebuild_revenue`.
+
+# (date field, kind) of every followed model
+SOURCES = {
+    Invoice: ("created_at", "invoiced"),
+    Payment: ("payment_date", "payed"),
+}
+
+# Snapshot of an instance loaded without its date or value (.only()/.defer())
+NOT_LOADED = object()
+
+def local_day(value):
+    """The local calendar day of a date, a datetime or a posted date string."""
+    if isinstance(value, str):
+        value = parse_datetime(value) or parse_date(value[:10])
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value if isinstance(value, date) else None
+
+def snapshot(instance):
+    """The fields of a document that its revenue contribution depends on."""
+    date_field = SOURCES[type(instance)][0]
+    return (getattr(instance, date_field), instance.is_client, instance.currency_id, instance.value)
+
+def contribution(model, state):
+    """Turns a snapshot into ({rollup key: value}), empty for documents without a date."""
+    if state is None:
+        return {}
+    value_date, is_client, currency_id, value = state
+    day = local_day(value_date)
+    if day is None or not value:
+        return {}
+    return {(day, is_client, SOURCES[model][1], currency_id): value}
+
+def apply_deltas(deltas):
+    """Adds the {(day, is_client, kind, currency_id): amount} deltas to the daily rollups."""
+    invalidate_days({key[0] for key, amount in deltas.items() if amount})
+    for (day, is_client, kind, currency_id), amount in deltas.items():
+        if not amount:
+            continue
+        key = {"day": day, "is_client": is_client, "kind": kind, "currency_id": currency_id}
+        rows = RevenueDay.objects.filter(**key)
+        if rows.update(value=F("value") + amount):
+            continue
+        try:
+            with transaction.atomic():
+                RevenueDay.objects.create(value=amount, **key)
+        except IntegrityError:
+            # Another request created the row in the meantime
+            rows.update(value=F("value") + amount)
+
+def apply_change(model, old, new):
+    """Moves a document's contribution from its old snapshot to its new one."""
+    deltas = contribution(model, new)
+    for key, value in contribution(model, old).items():
+        deltas[key] = deltas.get(key, 0) - value
+    apply_deltas(deltas)
+
+def apply_changes(instances):
+    """Follows a bulk_update of loaded invoices or payments, which sends no signals."""
+    for instance in instances:
+        state = snapshot(instance)
+        apply_change(type(instance), instance._revenue, state)
+        instance._revenue = state
+
+# Rebuilds the rollups of a day range from the documents, days in the local time zone
+REBUILD = f"""
+    INSERT INTO {RevenueDay._meta.db_table} (day, is_client, kind, currency_id, value)
+    SELECT (created_at AT TIME ZONE %(tz)s)::date, is_client, 'invoiced', currency_id, SUM(value)
+    FROM {Invoice._meta.db_table}
+    WHERE (%(start)s::date IS NULL OR (created_at AT TIME ZONE %(tz)s)::date >= %(start)s)
+    AND (%(end)s::date IS NULL OR (created_at AT TIME ZONE %(tz)s)::date <= %(end)s)
+    GROUP BY 1, 2, 4
+    UNION ALL
+    SELECT payment_date, is_client, 'payed', currency_id, SUM(value)
+    FROM {Payment._meta.db_table}
+    WHERE (%(start)s::date IS NULL OR payment_date >= %(start)s)
+    AND (%(end)s::date IS NULL OR payment_date <= %(end)s)
+    GROUP BY 1, 2, 4
+"""
+
+def rebuild(start=None, end=None):
+    """Recalculates the rollups between two days (both optional) with two set based statements."""
+    rows = RevenueDay.objects.all()
+    if start:
+        rows = rows.filter(day__gte=start)
+    if end:
+        rows = rows.filter(day__lte=end)
+    with transaction.atomic(), connection.cursor() as cursor:
+        invalidate_all()
+        rows.delete()
+        cursor.execute(REBUILD, {"tz": settings.TIME_ZONE, "start": start, "end": end})
+        return cursor.rowcount
+
+# signal receivers
+
+def document_loaded(sender, instance, **kwargs):
+    if not instance.pk:
+        instance._revenue = None
+    elif {SOURCES[sender][0], "is_client", "currency_id", "value"} & instance.get_deferred_fields():
+        instance._revenue = NOT_LOADED  # read from the database before the next save or delete
+    else:
+        instance._revenue = snapshot(instance)
+
+def document_changing(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk and getattr(instance, "_revenue", NOT_LOADED) is NOT_LOADED:
+        stored = sender.objects.filter(pk=instance.pk).first()
+        instance._revenue = snapshot(stored) if stored else None
+
+def document_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    state = snapshot(instance)
+    apply_change(sender, None if created else instance._revenue, state)
+    instance._revenue = state
+
+def document_deleted(sender, instance, **kwargs):
+    apply_change(sender, instance._revenue, None)
+
+def connect():
+    for model in SOURCES:
+        post_init.connect(document_loaded, sender=model)
+        pre_save.connect(document_changing, sender=model)
+        post_save.connect(document_saved, sender=model)
+        pre_delete.connect(document_changing, sender=model)
+        post_delete.connect(document_deleted, sender=model)
@@ -3,4 +3,7 @@ from . import views
 
 urlpatterns = [
     path("reports/revenue/", views.revenue, name="revenue"),
+    path("reports/revenue/stats/", views.revenue_stats, name="revenue_stats"),
+    path("reports/export/", views.export_documents, name="export_documents"),
+    path("reports/export/<int:job_id>/", views.export_download, name="export_download"),
 ]
@@ -1,8 +1,10 @@
-from django.shortcuts import render
+import os
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import FileResponse, JsonResponse, Http404, HttpResponseNotAllowed
 from django.contrib.auth.decorators import login_required
 from django.db.models import Sum
-from payments.models import Payment
-from invoices.models import Invoice
+from .models import RevenueDay
+from .caching import cached_report, cache_stats
 from django.utils import timezone
 from datetime import datetime, timedelta
 from django.db.models.functions import (
@@ -12,6 +14,10 @@ from django.db.models.functions import (
     TruncYear,
 )
 import json
+from common.helpers import get_date_range
+from common.exports import EXPORT_TYPES, export_path
+from common.jobs import enqueue
+from common.models import Job
 
 @login_required(login_url="/login/")
 def revenue(request):
@@ -36,6 +42,25 @@ def revenue(request):
     else:
         range_type = 'Jährlich'
     
+    # Același interval este cerut des, rezultatul este păstrat în cache până la o modificare în interval
+    report = cached_report(
+        date_start.date(), date_end.date(), range_type,
+        lambda: revenue_report(date_start, date_end, range_type),
+    )
+
+    return render(request, "reports/revenue.html", dict(
+        report,
+        date_start=date_start.strftime("%Y-%m-%d"),
+        date_end=date_end.strftime("%Y-%m-%d"),
+        range_type=range_type,
+    ))
+
+@login_required(login_url="/login/")
+def revenue_stats(request):
+    return JsonResponse(cache_stats())
+
+def revenue_report(date_start, date_end, range_type):
+    """Computes the buckets, totals and chart data of the revenue report."""
     # Determine truncation and step depending on range_type
     if range_type == 'Täglich':
         trunc_func = TruncDay
@@ -54,40 +79,21 @@ def revenue(request):
         step = timedelta(days=365)
         fmt = "%Y"
 
-    invoices = (
-        Invoice.objects.filter(created_at__gte=date_start, created_at__lt=date_end)
-        .annotate(bucket=trunc_func("created_at"))
-        .values("bucket", "is_client")
-        .annotate(total=Sum("value"))
-    )
-
-    payments = (
-        Payment.objects.filter(payment_date__gte=date_start, payment_date__lt=date_end)
-        .annotate(bucket=trunc_func("payment_date"))
-        .values("bucket", "is_client")
+    # Daily rollups (reports.rollups) summed into the buckets, instead of scanning the documents
+    rollups = (
+        RevenueDay.objects.filter(day__gte=date_start.date(), day__lt=date_end.date())
+        .annotate(bucket=trunc_func("day"))
+        .values("bucket", "is_client", "kind")
         .annotate(total=Sum("value"))
+        .order_by()
     )
 
     invoice_dict = {}
-    for row in invoices:
-        key = row["bucket"]
-        entry = invoice_dict.setdefault(key, {"in": 0, "out": 0})
-        value = row["total"] or 0
-        if row["is_client"]:
-            if value >= 0:
-                entry["in"] += value
-            else:
-                entry["out"] += abs(value)  # => client invoice cu minus => out
-        else:
-            if value >= 0:
-                entry["out"] += value
-            else:
-                entry["in"] += abs(value)  # => provider invoice cu minus => in
-
     payment_dict = {}
-    for row in payments:
+    for row in rollups:
         key = row["bucket"]
-        entry = payment_dict.setdefault(key, {"in": 0, "out": 0})
+        bucket_dict = invoice_dict if row["kind"] == "invoiced" else payment_dict
+        entry = bucket_dict.setdefault(key, {"in": 0, "out": 0})
         value = row["total"] or 0
         if row["is_client"]:
             if value >= 0:
@@ -173,12 +179,38 @@ def revenue(request):
         ]
     })
 
-    return render(request, "reports/revenue.html", {
-        'revenue': revenue,
-        'date_start': date_start.strftime("%Y-%m-%d"),
-        'date_end': date_end.strftime("%Y-%m-%d"),
-        'total_payed_in': '%.2f' % total_payed_in,
-        'total_payed_out': '%.2f' % total_payed_out,
-        'range_type': range_type,
+    return {
+        "revenue": revenue,
+        "total_payed_in": '%.2f' % total_payed_in,
+        "total_payed_out": '%.2f' % total_payed_out,
         "chart_data": chart_data,
-    })
\ No newline at end of file
+    }
+
+@login_required(login_url="/login/")
+def export_documents(request):
+    # Exportul este randat de worker (run_worker), cererea doar pune jobul în coadă
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    filter_start, filter_end, reg_start, reg_end = get_date_range(request, default_days=31)
+    types = [t for t in request.POST.getlist("type") if t in EXPORT_TYPES] or list(EXPORT_TYPES)
+    params = {
+        "types": types,
+        "start": filter_start.isoformat(),
+        "end": filter_end.isoformat(),
+        "format": "pdf" if request.POST.get("format") == "pdf" else "zip",
+    }
+    job = enqueue("export_documents", params, key=f"export_documents:{os.path.basename(export_path(params))}")
+    return redirect("export_download", job_id=job.id)
+
+@login_required(login_url="/login/")
+def export_download(request, job_id):
+    # Până când jobul este gata pagina îi urmărește starea, apoi servește fișierul
+    job = get_object_or_404(Job, id=job_id, task="export_documents")
+    # Un export cu documente lipsă este arătat înainte de descărcare
+    if job.status != "done" or (job.result["failed"] and "download" not in request.GET):
+        return render(request, "reports/export.html", {"job": job})
+    path = job.result["path"]
+    if not os.path.exists(path):
+        raise Http404
+    filename = f"Export-{job.payload['start'][:10]}-{job.payload['end'][:10]}.{job.payload['format']}"
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=filename)
@@ -1,5 +1,5 @@
 from django.contrib.auth.models import User
-from services.models import Status, UM, Service, Currency, Serial
+from services.models import Status, UM, Service, Currency, Series
 from users.models import CustomUser
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from io import BytesIO
@@ -41,20 +41,16 @@ def run():
         UM.objects.get_or_create(name=u)
     um = UM.objects.first()
 
-    Serial.objects.get_or_create(
-        offer_serial='A',
-        offer_number=1,
-        order_serial='B',
-        order_number=1,
-        p_order_serial='P',
-        p_order_number=1,
-        proforma_serial='PRO',
-        proforma_number=1,
-        invoice_serial='RE',
-        invoice_number=1,
-        receipt_serial='BE',
-        receipt_number=1,
-    )
+    series = [
+        ("offer", "A"),
+        ("order", "B"),
+        ("p_order", "P"),
+        ("proforma", "PRO"),
+        ("invoice", "RE"),
+        ("receipt", "BE"),
+    ]
+    for name, serial in series:
+        Series.objects.get_or_create(name=name, defaults={"serial": serial, "number": 1})
 
     currencies = [("€", "Euro"), ("$", "Dollar"), ("ron", "Leu")]
     for c in currencies:
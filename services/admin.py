@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Status, Service, UM, Currency, Serial
+from .models import Status, Service, UM, Currency, Series
 
 # Register your models here.
 
@@ -7,4 +7,4 @@ admin.site.register(Service)
 admin.site.register(UM)
 admin.site.register(Currency)
 admin.site.register(Status)
-admin.site.register(Serial)
\ No newline at end of file
+admin.site.register(Series)
\ No newline at end of file
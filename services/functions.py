@@ -0,0 +1,51 @@
+from django.db import connection, transaction
+from django.db.transaction import TransactionManagementError
+from .models import Series
+
+# helping functions
+
+# Number series, each on its own Series row with a serial prefix and the next number
+SERIES = tuple(name for name, label in Series.series_choices)
+
+def _check_series(series):
+    if series not in SERIES:
+        raise ValueError(f"Unknown series: {series}")
+
+def peek_number(series):
+    """Returns the (serial, number) the next document of the series would get, without reserving it."""
+    _check_series(series)
+    return Series.objects.values_list("serial", "number").get(name=series)
+
+def next_number(series):
+    """
+    Reserves the next number of a series and returns (serial, number).
+    The counter is incremented with one UPDATE ... RETURNING, so two users never get the same number.
+    The series' row stays locked until the surrounding transaction ends: create the document in the same
+    transaction and a rollback gives the number back, which keeps invoices and receipts gapless.
+    Every series has its own row, so an open invoice transaction does not hold up offers or receipts.
+    """
+    _check_series(series)
+    if not transaction.get_connection().in_atomic_block:
+        raise TransactionManagementError("next_number() must be called inside transaction.atomic().")
+    table = connection.ops.quote_name(Series._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET number = number + 1 WHERE name = %s RETURNING serial, number - 1", [series]
+        )
+        row = cursor.fetchone()
+    if row is None:
+        raise Series.DoesNotExist(f"The {series} series is missing.")
+    return row[0], row[1]
+
+def release_number(series, number):
+    """
+    Gives a number back to its series if it is still the last one handed out,
+    e.g. when the last cash receipt is turned into a bank payment. Returns True if it was released.
+    """
+    _check_series(series)
+    try:
+        number = int(number)
+    except (TypeError, ValueError):
+        return False
+    # Only the last number can go back, otherwise the series would get a gap or a duplicate
+    return Series.objects.filter(name=series, number=number + 1).update(number=number) == 1
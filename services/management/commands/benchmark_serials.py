@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import setup_databases, teardown_databases
+from services.models import Series
+from services.functions import SERIES, next_number
+
+
+class Command(BaseCommand):
+    help = 'Measures number allocation throughput with parallel creators, on a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--series", default="offer", help=f"Series to allocate from ({', '.join(SERIES)}, default offer).")
+        parser.add_argument("--creators", type=int, default=16, help="Number of parallel creators (default 16).")
+        parser.add_argument("--count", type=int, default=200, help="Numbers allocated by every creator (default 200).")
+        parser.add_argument(
+            "--hold", type=float, default=0, help="Milliseconds each transaction stays open after the allocation, like a document save."
+        )
+
+    def handle(self, *args, **options):
+        series = options["series"]
+        if series not in SERIES:
+            raise CommandError(f"Unknown series: {series}")
+        creators, count, hold = max(1, options["creators"]), max(1, options["count"]), options["hold"] / 1000
+
+        def allocate():
+            with transaction.atomic():
+                number = next_number(series)[1]
+                time.sleep(hold)
+            return number
+
+        def read_modify_write():
+            # What the views did before: read the row, increment in Python and save it back
+            with transaction.atomic():
+                row = Series.objects.get(name=series)
+                number = row.number
+                row.number = number + 1
+                row.save()
+                time.sleep(hold)
+            return number
+
+        # The creators commit, so they run against a test database (test_<NAME>) and never touch the live counters
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.stdout.write(f"{creators} creators x {count} {series} numbers, {options['hold']:g} ms hold")
+            for label, create in (("allocator", allocate), ("read-modify-write", read_modify_write)):
+                Series.objects.update_or_create(name=series, defaults={"number": 1})
+                numbers, elapsed = self.run(create, creators, count)
+                duplicates = sum(n - 1 for n in Counter(numbers).values() if n > 1)
+                last = Series.objects.values_list("number", flat=True).get(name=series)
+                gaps = (last - 1) - len(set(numbers))
+                self.stdout.write(
+                    f"  {label:18} {len(numbers) / elapsed:8.0f} numbers/s, {duplicates} duplicates, {gaps} gaps"
+                )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        self.stdout.write(self.style.SUCCESS("Test database removed."))
+
+    def run(self, create, creators, count):
+        numbers = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(creators + 1)
+
+        def creator():
+            try:
+                barrier.wait()
+                taken = [create() for _ in range(count)]
+                with lock:
+                    numbers.extend(taken)
+            finally:
+                # Every thread has its own database connection
+                connection.close()
+
+        threads = [threading.Thread(target=creator) for _ in range(creators)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return numbers, time.perf_counter() - started
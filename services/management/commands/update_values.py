@@ -1,41 +1,138 @@
-from django.core.management.base import BaseCommand
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from orders.models import Order, OrderElement
 from invoices.models import Invoice, InvoiceElement
 from payments.models import Payment, PaymentElement
-from django.db.models import Sum, F
+
+# Computed invoiced value for every order in an id range, excluding cancelled invoices
+ORDERS_INVOICED = f"""
+    SELECT o.id, o.invoiced AS stored, COALESCE(SUM(
+        CASE WHEN i.id IS NOT NULL THEN e.price * e.quantity END
+    ), 0) AS computed
+    FROM {Order._meta.db_table} o
+    LEFT JOIN {OrderElement._meta.db_table} e ON e.order_id = o.id
+    LEFT JOIN {InvoiceElement._meta.db_table} ie ON ie.element_id = e.id
+    LEFT JOIN {Invoice._meta.db_table} i ON i.id = ie.invoice_id
+        AND i.cancelled_from_id IS NULL
+        AND i.cancellation_to_id IS NULL
+    WHERE o.id BETWEEN %(start)s AND %(end)s
+    AND (%(since)s IS NULL OR o.modified_at >= %(since)s OR EXISTS (
+        SELECT 1 FROM {OrderElement._meta.db_table} se
+        JOIN {InvoiceElement._meta.db_table} sie ON sie.element_id = se.id
+        JOIN {Invoice._meta.db_table} si ON si.id = sie.invoice_id
+        WHERE se.order_id = o.id AND si.modified_at >= %(since)s
+    ))
+    GROUP BY o.id, o.invoiced
+"""
+
+# Computed payed value for every invoice in an id range
+INVOICES_PAYED = f"""
+    SELECT i.id, i.payed AS stored, COALESCE(SUM(pe.value), 0) AS computed
+    FROM {Invoice._meta.db_table} i
+    LEFT JOIN {PaymentElement._meta.db_table} pe ON pe.invoice_id = i.id
+    WHERE i.id BETWEEN %(start)s AND %(end)s
+    AND (%(since)s IS NULL OR i.modified_at >= %(since)s OR EXISTS (
+        SELECT 1 FROM {PaymentElement._meta.db_table} spe
+        JOIN {Payment._meta.db_table} sp ON sp.id = spe.payment_id
+        WHERE spe.invoice_id = i.id AND sp.modified_at >= %(since)s
+    ))
+    GROUP BY i.id, i.payed
+"""
+
 
 class Command(BaseCommand):
     help = 'Updates all invoiced and payed values across the database'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help="Only rebuild documents modified after this date or timestamp (YYYY-MM-DD[ HH:MM]).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List the rows whose invoiced/payed value would change without writing them.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Number of ids processed per statement (default 5000).",
+        )
+
     def handle(self, *args, **options):
+        since = self.parse_since(options["since"])
+        self.dry_run = options["dry_run"]
+        self.chunk_size = max(1, options["chunk_size"])
+
         self.stdout.write(self.style.SUCCESS('Starting to update all financial records...'))
+        started = time.perf_counter()
 
         # Actualizare invoiced pentru Orders
-        for order in Order.objects.all():
-            order_invoiced_total = InvoiceElement.objects.filter(
-                element__order=order,
-                invoice__cancelled_from__isnull=True, # Exclude cancelled invoices
-                invoice__cancellation_to__isnull=True # Exclude cancelled invoices
-            ).aggregate(
-                total_invoiced=Sum(F('element__price') * F('element__quantity'))
-            )['total_invoiced'] or 0
-
-            order.invoiced = order_invoiced_total
-            order.save()
-
-        self.stdout.write(self.style.SUCCESS('All orders have been updated successfully.'))
+        changed = self.rebuild(Order, "invoiced", ORDERS_INVOICED, since)
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING(f'{changed} orders would be updated (dry run).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{changed} orders have been updated successfully.'))
 
         # Actualizare payed pentru Invoices
-        for invoice in Invoice.objects.all():
-            invoice_payed_total = PaymentElement.objects.filter(
-                invoice=invoice
-            ).aggregate(
-                total_payed=Sum('payment__value')
-            )['total_payed'] or 0
+        changed = self.rebuild(Invoice, "payed", INVOICES_PAYED, since)
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING(f'{changed} invoices would be updated (dry run).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{changed} invoices have been updated successfully.'))
+
+        self.stdout.write(self.style.SUCCESS(f'Update complete in {time.perf_counter() - started:.2f}s!'))
 
-            invoice.payed = invoice_payed_total
-            invoice.save()
+    def parse_since(self, value):
+        if not value:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            since_date = parse_date(value)
+            if since_date is None:
+                raise CommandError(f"Invalid --since value: {value}")
+            since = datetime.combine(since_date, datetime.min.time())
+        return timezone.make_aware(since) if timezone.is_naive(since) else since
 
-        self.stdout.write(self.style.SUCCESS('All invoices have been updated successfully.'))
+    def rebuild(self, model, column, computed_sql, since):
+        """Writes the computed column with one UPDATE ... FROM (SELECT ... GROUP BY) per id range."""
+        table = model._meta.db_table
+        bounds = model.objects.aggregate(first=Min("id"), last=Max("id"))
+        if bounds["first"] is None:
+            return 0
 
-        self.stdout.write(self.style.SUCCESS('Update complete!'))
+        changed = 0
+        for start in range(bounds["first"], bounds["last"] + 1, self.chunk_size):
+            end = start + self.chunk_size - 1
+            params = {"start": start, "end": end, "since": since}
+            chunk_started = time.perf_counter()
+            with transaction.atomic(), connection.cursor() as cursor:
+                if self.dry_run:
+                    cursor.execute(
+                        f"SELECT id, stored, computed FROM ({computed_sql}) t "
+                        f"WHERE stored IS DISTINCT FROM computed ORDER BY id",
+                        params,
+                    )
+                    rows = cursor.fetchall()
+                    for pk, stored, computed in rows:
+                        self.stdout.write(f"  {model.__name__} #{pk}: {column} {stored} -> {computed}")
+                    count = len(rows)
+                else:
+                    cursor.execute(
+                        f"UPDATE {table} SET {column} = t.computed FROM ({computed_sql}) t "
+                        f"WHERE {table}.id = t.id AND t.stored IS DISTINCT FROM t.computed",
+                        params,
+                    )
+                    count = cursor.rowcount
+            changed += count
+            self.stdout.write(
+                f"{table} {start}-{end}: {count} {'to change' if self.dry_run else 'changed'} "
+                f"in {time.perf_counter() - chunk_started:.3f}s"
+            )
+        return changed
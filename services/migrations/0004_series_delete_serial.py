@@ -0,0 +1,69 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+SERIES = ("offer", "order", "p_order", "proforma", "invoice", "receipt")
+
+
+def split_serials(apps, schema_editor):
+    # The counters of the single Serial row become one Series row each
+    Serial = apps.get_model("services", "Serial")
+    Series = apps.get_model("services", "Series")
+    serials = Serial.objects.order_by("id").first()
+    if serials is None:
+        return
+    Series.objects.bulk_create([
+        Series(name=name, serial=getattr(serials, f"{name}_serial"), number=getattr(serials, f"{name}_number"))
+        for name in SERIES
+    ])
+
+
+def join_serials(apps, schema_editor):
+    Serial = apps.get_model("services", "Serial")
+    Series = apps.get_model("services", "Series")
+    fields = {}
+    for series in Series.objects.all():
+        fields[f"{series.name}_serial"] = series.serial
+        fields[f"{series.name}_number"] = series.number
+    if fields:
+        Serial.objects.create(id=1, **fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("services", "0003_delete_serialul"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Series",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "name",
+                    models.CharField(
+                        choices=[
+                            ("offer", "Offers"),
+                            ("order", "Client orders"),
+                            ("p_order", "Provider orders"),
+                            ("proforma", "Proformas"),
+                            ("invoice", "Invoices"),
+                            ("receipt", "Receipts"),
+                        ],
+                        max_length=10,
+                        unique=True,
+                    ),
+                ),
+                ("serial", models.CharField(blank=True, max_length=10)),
+                ("number", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name_plural": "series",
+            },
+        ),
+        migrations.RunPython(split_serials, join_serials),
+        migrations.DeleteModel(
+            name="Serial",
+        ),
+    ]
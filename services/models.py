@@ -42,23 +42,27 @@ class Service(models.Model):
     def __str__(self):
         return f"{self.name}"
 
-class Serial(models.Model):
-    offer_serial = models.CharField(max_length=10, blank=True)
-    offer_number = models.PositiveIntegerField(default=0)
-    order_serial = models.CharField(max_length=10, blank=True)
-    order_number = models.PositiveIntegerField(default=0)
-    p_order_serial = models.CharField(max_length=10, blank=True)
-    p_order_number = models.PositiveIntegerField(default=0)
-    proforma_serial = models.CharField(max_length=10, blank=True)
-    proforma_number = models.PositiveIntegerField(default=0)
-    invoice_serial = models.CharField(max_length=10, blank=True)
-    invoice_number = models.PositiveIntegerField(default=0)
-    receipt_serial = models.CharField(max_length=10, blank=True)
-    receipt_number = models.PositiveIntegerField(default=0)
+class Series(models.Model):
+    """A number series with its own row, so reserving a number locks only the documents of that series."""
+    series_choices = [
+        ("offer", "Offers"),
+        ("order", "Client orders"),
+        ("p_order", "Provider orders"),
+        ("proforma", "Proformas"),
+        ("invoice", "Invoices"),
+        ("receipt", "Receipts"),
+    ]
+    name = models.CharField(max_length=10, choices=series_choices, unique=True)
+    serial = models.CharField(max_length=10, blank=True)
+    number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "series"
 
     def __str__(self):
-        return f"Serial numbers of all entries"
-    
+        return f"{self.get_name_display()}: {self.serial} {self.number}"
+
+
 class TimestampedModel(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     created_by = models.ForeignKey(
@@ -1,3 +1,33 @@
+from django.db import transaction
 from django.test import TestCase
+from .models import Series
+from .functions import next_number, peek_number, release_number
 
-# Create your tests here.
+
+class NumberSeriesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Series.objects.create(name="invoice", serial="RE", number=7)
+        Series.objects.create(name="receipt", serial="BE", number=3)
+
+    def test_next_number_counts_its_own_series(self):
+        with transaction.atomic():
+            self.assertEqual(next_number("invoice"), ("RE", 7))
+            self.assertEqual(next_number("invoice"), ("RE", 8))
+        self.assertEqual(peek_number("invoice"), ("RE", 9))
+        self.assertEqual(peek_number("receipt"), ("BE", 3))
+
+    def test_a_rollback_gives_the_number_back(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            next_number("receipt")
+            raise RuntimeError
+        self.assertEqual(peek_number("receipt"), ("BE", 3))
+
+    def test_only_the_last_number_is_released(self):
+        with transaction.atomic():
+            next_number("receipt")
+            next_number("receipt")
+        self.assertFalse(release_number("receipt", 3))
+        self.assertTrue(release_number("receipt", 4))
+        self.assertEqual(peek_number("receipt"), ("BE", 4))
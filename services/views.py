@@ -2,6 +2,8 @@ from django.shortcuts import render, get_object_or_404, redirect
 from .models import Status, UM, Currency, Service
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from common.helpers import paginate_objects
+from common.jobs import enqueue
 import paramiko
 from django.conf import settings
 import os
@@ -33,9 +35,7 @@ def upload_file_via_sftp(local_file_path, remote_file_path):
 @login_required(login_url="/login/")
 def services(request):
     services = Service.objects.all().order_by('id')
-    paginator = Paginator(services, 10)
-    page = request.GET.get("page")
-    services_on_page = paginator.get_page(page)
+    services_on_page = paginate_objects(request, services, keyset=True, estimate=True)
     return render(request, "services/services.html", {"services": services_on_page})
 
 
@@ -108,7 +108,7 @@ def status_detail(request, status_id):
             status.style = request.POST.get("style")
             status.percent = request.POST.get("percent")
             status.save()
-            upload_file_via_sftp(file_path, '/sprachen-express/logo-se.jpg')
+            enqueue("sftp_upload", {"local": file_path, "remote": '/sprachen-express/logo-se.jpg'}, key="sftp_upload:logo")
         else:
             update = ""
     else:
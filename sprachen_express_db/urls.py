@@ -32,6 +32,7 @@ urlpatterns = [
     path("", include("reports.urls")),
     path("", include("services.urls")),
     path("", include("users.urls")),
+    path("", include("common.urls")),
 ]
 
 def custom_page_not_found(request, exception):
@@ -1,174 +1,105 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth.views import redirect_to_login
 from django.views.decorators.csrf import csrf_protect
-from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
-from django.db.models import Sum, Case, When, Value, F, DecimalField
-from django.db.models.functions import Coalesce
-from orders.models import Order, OrderElement
-from payments.models import Payment, PaymentElement
-from invoices.models import Invoice, InvoiceElement, ProformaElement
-from datetime import datetime, timezone
-
-
-@login_required(login_url="/login/")
-def dashboard(request):
-    # recent orders box
-    selected_orders = Order.objects.all().order_by("-created_at")[:10]
-    recent_orders = []
-    for o in selected_orders:
-        order_elements = OrderElement.objects.filter(order=o).order_by("id")
-        status = o.status
-        recent_orders.append({"order": o, "elements": order_elements, "status": status})
-
-    # last unfinished client orders
-    selected_orders = Order.objects.filter(is_client=True, status__percent__gt=0, status__percent__lt=100).order_by("deadline")[:10]
-    client_orders = []
-    for o in selected_orders:
-        order_elements = OrderElement.objects.filter(order=o).order_by("id")
-        o_status = o.status
-        proformed = next((ProformaElement.objects.filter(element=e).first() for e in order_elements if ProformaElement.objects.filter(element=e).exists()), None)
-        o_invoiced = 0
-        for e in order_elements:
-            try:
-                invoice_element = InvoiceElement.objects.get(element=e)
-                o_invoiced += (
-                    invoice_element.element.price * invoice_element.element.quantity
-                )
-            except:
-                invoice_element = None
-        if o.value > 0:
-            invoiced = int(o_invoiced / o.value * 100)
-        else:
-            invoiced = 0
-
-        if o.deadline < datetime.now(timezone.utc):
-            alert = "text-danger"
-        else:
-            alert = ""
-
-        client_orders.append(
-            {
-                "order": o,
-                "elements": order_elements,
-                "status": o_status,
-                "invoiced": invoiced,
-                "proformed": proformed,
-                "alert": alert
-            }
-        )
-
-    # last unfinished provider orders
-    selected_orders = Order.objects.filter(is_client=False, status__percent__gt=0, status__percent__lt=100).order_by("deadline")[:10]
-    provider_orders = []
-    for o in selected_orders:
-        order_elements = OrderElement.objects.filter(order=o).order_by("id")
-        o_status = o.status
-        o_value = 0
-        o_invoiced = 0
-        for e in order_elements:
-            try:
-                invoice_element = InvoiceElement.objects.get(element=e)
-                o_invoiced += (
-                    invoice_element.element.price * invoice_element.element.quantity
-                )
-            except:
-                invoice_element = None
-        if o.value > 0:
-            invoiced = int(o_invoiced / o.value * 100)
-        else:
-            invoiced = 0
-
-        if o.deadline < datetime.now(timezone.utc):
-            alert = "text-danger"
-        else:
-            alert = ""
-
-        provider_orders.append(
-            {
-                "order": o,
-                "elements": order_elements,
-                "status": o_status,
-                "invoiced": invoiced,
-                "alert": alert
-            }
-        )
-
-    # last unpayed client invoices
-    invoices_with_payments = Invoice.objects.filter(
-        is_client=True
-    ).annotate(
-        total_paid=Coalesce(Sum(
-            Case(
-                When(paymentelement__payment__value__lte=F('value'), then='paymentelement__payment__value'),
-                default=Value(0, output_field=DecimalField()),  # Dacă nu există plăți, sau sunt invalide, suma este zero
-                output_field=DecimalField()
-            )
-        ), Value(0, output_field=DecimalField()))  # Setting all nulls to zero
-    ).order_by('-deadline')
-
-    # Select all invoices where the total is less than the invoice value (inclusiv without payments)
-    partially_paid_invoices = invoices_with_payments.filter(
-        total_paid__lt=F('value')
-    )
-
-    client_invoices = []
-    for invoice in partially_paid_invoices[:15]:
-        payed_percentage = (invoice.total_paid / invoice.value * 100) if invoice.value else 0
-        payed_percentage = int(payed_percentage)
-        
-        current_date = datetime.now().date()
-        alert = "text-danger" if invoice.deadline < current_date else ""
-        
-        client_invoices.append({
-            "invoice": invoice,
-            "payed": payed_percentage,
-            "alert": alert
-        })
-
-    # last unpayed provider invoices
-    invoices_with_payments = Invoice.objects.filter(
-        is_client=False
-    ).annotate(
-        total_paid=Coalesce(Sum(
-            Case(
-                When(paymentelement__payment__value__lte=F('value'), then='paymentelement__payment__value'),
-                default=Value(0, output_field=DecimalField()),  # Dacă nu există plăți, sau sunt invalide, suma este zero
-                output_field=DecimalField()
-            )
-        ), Value(0, output_field=DecimalField()))  # Setting all nulls to zero
-    ).order_by('-deadline')
-
-    # Select all invoices where the total is less than the invoice value (inclusiv without payments)
-    partially_paid_invoices = invoices_with_payments.filter(
-        total_paid__lt=F('value')
-    )
-
-    provider_invoices = []
-    for invoice in partially_paid_invoices[:15]:
-        payed_percentage = (invoice.total_paid / invoice.value * 100) if invoice.value else 0
-        payed_percentage = int(payed_percentage)
-        
-        current_date = datetime.now().date()
-        alert = "text-danger" if invoice.deadline < current_date else ""
-        
-        provider_invoices.append({
-            "invoice": invoice,
-            "payed": payed_percentage,
-            "alert": alert
-        })
-
-
-    return render(
-        request,
-        "dashboard.html",
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.db import close_old_connections
+from django.utils import timezone
+from orders.models import Order
+from orders.functions import annotate_orders, order_rows
+from invoices.functions import open_items
+from common.fragments import cached_fragment
+
+
+# The dashboard boxes are independent, so they run at the same time on a bounded pool,
+# each thread with its own database connection
+DASHBOARD_POOL = ThreadPoolExecutor(max_workers=5, thread_name_prefix="dashboard")
+
+def order_box(orders):
+    """
+    One query for the rows of an order box plus one prefetch of their elements.
+    Returns the rows and the next deadline, when the alert of a row turns on.
+    """
+    now = timezone.now()
+    rows = order_rows(annotate_orders(orders)[:10])
+    for row in rows:
+        row["status"] = row["order"].status
+        row["alert"] = "text-danger" if row["order"].deadline < now else ""
+    upcoming = [row["order"].deadline for row in rows if row["order"].deadline >= now]
+    return rows, min(upcoming, default=None)
+
+def invoice_box(is_client):
+    """
+    The open items (unpaid invoices) of clients or providers.
+    Returns the rows and the next midnight if an alert can still turn on.
+    """
+    today = timezone.localdate()
+    invoices = open_items().filter(is_client=is_client).select_related("person").order_by("-deadline")[:15]
+    rows = [
         {
-            "recent_orders": recent_orders,
-            "client_orders": client_orders,
-            "provider_orders": provider_orders,
-            "client_invoices": client_invoices,
-            "provider_invoices": provider_invoices,
-        },
+            "invoice": invoice,
+            "payed": int(invoice.payed / invoice.value * 100) if invoice.value else 0,
+            "alert": "text-danger" if invoice.deadline < today else "",
+        }
+        for invoice in invoices
+    ]
+    midnight = timezone.make_aware(datetime.combine(today + timedelta(days=1), datetime.min.time()))
+    return rows, midnight if any(row["invoice"].deadline >= today for row in rows) else None
+
+def open_orders():
+    return Order.objects.filter(status__percent__gt=0, status__percent__lt=100).order_by("deadline", "id")
+
+# name: (partial, box)
+DASHBOARD_BOXES = {
+    "client_orders": ("partials/dashboard_clients_status.html", lambda: order_box(open_orders().filter(is_client=True))),
+    "provider_orders": ("partials/dashboard_providers_status.html", lambda: order_box(open_orders().filter(is_client=False))),
+    "recent_orders": ("partials/dashboard_recent_orders.html", lambda: order_box(Order.objects.order_by("-created_at", "-id"))),
+    "client_invoices": ("partials/dashboard_clients_payments.html", lambda: invoice_box(True)),
+    "provider_invoices": ("partials/dashboard_providers_payments.html", lambda: invoice_box(False)),
+}
+
+def dashboard_box(name):
+    """Returns the html of a box from the fragment cache, whether it was a hit and the time it took."""
+    started = time.perf_counter()
+    partial, box = DASHBOARD_BOXES[name]
+
+    def render_box():
+        rows, expires = box()
+        return render_to_string(partial, {name: rows}), expires
+
+    try:
+        html, hit = cached_fragment(name, render_box)
+    finally:
+        close_old_connections()
+    return mark_safe(html), hit, time.perf_counter() - started
+
+async def dashboard(request):
+    # login_required does not wrap async views in Django 4.2
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return redirect_to_login(request.get_full_path(), "/login/")
+
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(DASHBOARD_POOL, dashboard_box, name) for name in DASHBOARD_BOXES
+    ))
+    boxes = dict(zip(DASHBOARD_BOXES, results))
+
+    response = await sync_to_async(render)(
+        request, "dashboard.html", {name: html for name, (html, hit, duration) in boxes.items()}
     )
+    timings = [
+        f'{name};desc="{"hit" if hit else "miss"}";dur={duration * 1000:.1f}'
+        for name, (html, hit, duration) in boxes.items()
+    ]
+    response["Server-Timing"] = ", ".join([f"dashboard;dur={(time.perf_counter() - started) * 1000:.1f}"] + timings)
+    return response
 
 
 @csrf_protect
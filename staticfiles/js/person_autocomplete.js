@@ -0,0 +1,34 @@
+(function($) {
+  'use strict';
+  // Fills the person select of an editor while typing, without posting the search form.
+  // <input data-autocomplete="client|provider" data-select="new_client"> inside the same .card-body as the select.
+  $(function() {
+    $('input[data-autocomplete]').each(function() {
+      var input = $(this);
+      var select = input.closest('.card-body').find('select[name="' + input.data('select') + '"]');
+      var timer = null;
+      var last = '';
+
+      input.on('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(function() {
+          var term = $.trim(input.val());
+          if (term.length < 3 || term === last) {
+            return;
+          }
+          last = term;
+          $.getJSON('/persons/autocomplete/', {q: term, role: input.data('autocomplete')}, function(data) {
+            if (term !== last) {
+              return;
+            }
+            select.empty();
+            $.each(data.results, function(i, p) {
+              var label = p.firstname + ' ' + p.lastname + ' - ' + p.company_name;
+              select.append($('<option>').val(p.id).text(label));
+            });
+          });
+        }, 200);
+      });
+    });
+  });
+})(jQuery);